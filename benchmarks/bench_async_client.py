@@ -0,0 +1,66 @@
+"""
+Compare serial MHClient lookups with AsyncMHClient fan-out against the
+local fake server. Run from the repo root:
+
+    python -m benchmarks.bench_async_client [--latency 0.02] [-n 200]
+"""
+
+import time
+import asyncio
+from argparse import ArgumentParser
+from pyhorn import MHClient, AsyncMHClient
+from .fake_server import FakeMatterhorn, serve
+
+
+def run_serial(base_url, n):
+    client = MHClient(base_url, cache_enabled=False)
+    start = time.time()
+    for i in range(n):
+        client.workflow(i)
+        client.job(i)
+        client.agent("ca%03d" % i)
+    return time.time() - start
+
+
+def run_async(base_url, n, workers):
+
+    async def fan_out():
+        async with AsyncMHClient(base_url, cache_enabled=False,
+                                 max_workers=workers) as client:
+            coros = []
+            for i in range(n):
+                coros.extend([client.workflow(i), client.job(i),
+                              client.agent("ca%03d" % i)])
+            await asyncio.gather(*coros)
+
+    loop = asyncio.new_event_loop()
+    start = time.time()
+    try:
+        loop.run_until_complete(fan_out())
+    finally:
+        loop.close()
+    return time.time() - start
+
+
+def main(args):
+    server, base_url = serve(FakeMatterhorn(latency=args.latency))
+    try:
+        total = args.n * 3
+        serial = run_serial(base_url, args.n)
+        print("serial MHClient:      %d requests in %.2fs (%.0f req/s)"
+              % (total, serial, total / serial))
+        concurrent = run_async(base_url, args.n, args.workers)
+        print("AsyncMHClient (%2d):   %d requests in %.2fs (%.0f req/s)"
+              % (args.workers, total, concurrent, total / concurrent))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', type=int, default=100,
+                        help="number of workflow/job/agent lookup triples")
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help="simulated server latency in seconds")
+    parser.add_argument('--workers', type=int, default=16)
+    main(parser.parse_args())
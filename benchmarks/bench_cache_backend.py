@@ -0,0 +1,63 @@
+"""
+A series of short-lived "scripts", each with a fresh MHClient, fetching the
+same workflow instances, with and without a shared SQLite cache backend. Each
+run is a separate process, like cron jobs or gunicorn workers. Run from the
+repo root:
+
+    python -m benchmarks.bench_cache_backend [--runs 5] [--workflows 200]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+from pyhorn import MHClient
+from .fake_server import FakeMatterhorn, serve
+
+
+def script(base_url, db_path, num_workflows):
+    client = MHClient(base_url, cache_backend=db_path)
+    start = time.time()
+    for wf_id in range(num_workflows):
+        client.workflow(wf_id)
+    elapsed = time.time() - start
+    hits = client.cache.backend_hits['WorkflowEndpoint.instance']
+    print("%f %d" % (elapsed, hits))
+
+
+def main(args):
+    app = FakeMatterhorn(latency=args.latency)
+    server, base_url = serve(app)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for label, db_path in (("in-memory only", None),
+                               ("sqlite backend", os.path.join(tmpdir, 'cache.db'))):
+            print(label)
+            for run in range(args.runs):
+                app.request_count = 0
+                out = subprocess.check_output(
+                    [sys.executable, '-m', 'benchmarks.bench_cache_backend',
+                     '--script', base_url, db_path or '',
+                     str(args.workflows)]).decode()
+                elapsed, hits = out.split()
+                print("  run %d: %.2fs, %4d requests, %4s backend hits"
+                      % (run + 1, float(elapsed), app.request_count, hits))
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--script']:
+        base_url, db_path, num_workflows = sys.argv[2:5]
+        script(base_url, db_path or None, int(num_workflows))
+        sys.exit()
+    parser = ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workflows', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help="simulated server latency in seconds")
+    main(parser.parse_args())
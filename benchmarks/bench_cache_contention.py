@@ -0,0 +1,79 @@
+"""
+EndpointCache throughput with many threads doing lookups on one method (the
+WorkflowEndpoint.instance pattern), with a small fraction of writes mixed
+in, while another thread periodically clears the cache. Run from the repo
+root:
+
+    python -m benchmarks.bench_cache_contention [--threads 1 8 64] [--ops 20000]
+"""
+
+import time
+import random
+import threading
+from argparse import ArgumentParser
+from pyhorn.endpoints.cache import EndpointCache
+
+METHOD = 'WorkflowEndpoint.instance'
+
+
+def run(num_threads, ops, keys, write_ratio, clear_interval):
+    cache = EndpointCache(sweep_interval=None, storage='frozen')
+    doc = {'id': 0, 'state': 'SUCCEEDED', 'operations': list(range(20))}
+    for key in range(keys):
+        cache.set(METHOD, key, doc, ttl=3600, max_entries=keys)
+
+    start_barrier = threading.Barrier(num_threads + 1)
+    done = threading.Event()
+    errors = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        start_barrier.wait()
+        try:
+            for i in range(ops):
+                key = rng.randrange(keys)
+                if rng.random() < write_ratio:
+                    cache.set(METHOD, key, doc, ttl=3600, max_entries=keys)
+                else:
+                    cache.lookup(METHOD, key)
+        except Exception as e:
+            errors.append(e)
+
+    def clearer():
+        while not done.wait(clear_interval):
+            cache.clear(METHOD)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(num_threads)]
+    for t in threads:
+        t.start()
+    clear_thread = threading.Thread(target=clearer)
+    clear_thread.start()
+    start_barrier.wait()
+    start = time.time()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+    done.set()
+    clear_thread.join()
+    return num_threads * ops / elapsed, errors
+
+
+def main(args):
+    for num_threads in args.threads:
+        ops_per_sec, errors = run(num_threads, args.ops, args.keys,
+                                  args.write_ratio, args.clear_interval)
+        print("%3d threads: %9.0f ops/s%s" % (
+            num_threads, ops_per_sec,
+            ", %d errors (first: %r)" % (len(errors), errors[0]) if errors else ""))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--ops', type=int, default=20000,
+                        help="operations per thread")
+    parser.add_argument('--keys', type=int, default=1000)
+    parser.add_argument('--write-ratio', type=float, default=0.02)
+    parser.add_argument('--clear-interval', type=float, default=0.05,
+                        help="seconds between clear() calls")
+    main(parser.parse_args())
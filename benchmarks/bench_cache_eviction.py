@@ -0,0 +1,86 @@
+"""
+Eviction quality of EndpointCache on a skewed (zipf-like) access trace of
+workflow lookups, comparing the previous "cull every third entry" policy with
+CLOCK (approximate LRU) eviction, by entry count and by byte budget. Run from
+the repo root:
+
+    python -m benchmarks.bench_cache_eviction [--keys 20000] [--requests 200000]
+"""
+
+import random
+import itertools
+from argparse import ArgumentParser
+from pyhorn.endpoints.cache import EndpointCache
+
+METHOD = 'WorkflowEndpoint.instance'
+
+
+class CullThirdCache(EndpointCache):
+    """
+    The previous policy: no recency tracking, and a full method drops every
+    third entry in insertion order
+    """
+
+    def _cull(self, method, count=1):
+        doomed = [k for (i, k) in enumerate(self._caches[method]) if i % 3 == 0]
+        for k in doomed:
+            self._delete(method, k)
+
+
+def make_trace(num_keys, num_requests, skew, seed=1):
+    rng = random.Random(seed)
+    weights = [1.0 / (rank ** skew) for rank in range(1, num_keys + 1)]
+    cum_weights = list(itertools.accumulate(weights))
+    # shuffle ids so popularity doesn't follow insertion order
+    ids = list(range(num_keys))
+    rng.shuffle(ids)
+    return [ids[i] for i in rng.choices(range(num_keys), cum_weights=cum_weights,
+                                         k=num_requests)]
+
+
+def make_payloads(num_keys, seed=2):
+    # workflow documents: mostly tens of KB, with a long tail of large ones
+    rng = random.Random(seed)
+    return [{'id': i, 'doc': 'x' * int(min(rng.lognormvariate(10, 1), 800000))}
+            for i in range(num_keys)]
+
+
+def replay(cache, trace, payloads, max_entries):
+    hits = 0
+    peak = 0
+    for wf_id in trace:
+        if cache.get(METHOD, wf_id) is not None:
+            hits += 1
+        else:
+            cache.set(METHOD, wf_id, payloads[wf_id], ttl=3600,
+                      max_entries=max_entries)
+            peak = max(peak, cache.total_bytes)
+    return hits / float(len(trace)), peak
+
+
+def main(args):
+    trace = make_trace(args.keys, args.requests, args.skew)
+    payloads = make_payloads(args.keys)
+    unbounded = args.keys + 1
+    runs = [
+        ("cull 1/3, max_entries=%d" % args.entries,
+         CullThirdCache(), args.entries),
+        ("CLOCK, max_entries=%d" % args.entries,
+         EndpointCache(), args.entries),
+        ("CLOCK, max_bytes=%dMB" % args.mb,
+         EndpointCache(max_bytes=args.mb * 1024 * 1024), unbounded),
+    ]
+    for label, cache, max_entries in runs:
+        hit_ratio, peak = replay(cache, trace, payloads, max_entries)
+        print("%-30s hit ratio %5.1f%%, peak payload bytes %6.1fMB"
+              % (label, 100 * hit_ratio, peak / 1024.0 / 1024.0))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--keys', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=200000)
+    parser.add_argument('--skew', type=float, default=0.9)
+    parser.add_argument('--entries', type=int, default=1000)
+    parser.add_argument('--mb', type=int, default=64)
+    main(parser.parse_args())
@@ -0,0 +1,72 @@
+"""
+Cache hit latency and memory per EndpointCache storage mode, using large
+workflow instance documents. Run from the repo root:
+
+    python -m benchmarks.bench_cache_storage [--entries 200] [--ops 40]
+"""
+
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pyhorn.endpoints.cache import EndpointCache
+from .fake_server import _workflow
+
+METHOD = 'WorkflowEndpoint.instance'
+
+
+def make_workflow(wf_id, num_ops):
+    wf = _workflow(wf_id)
+    op = wf['operations']['operation'][0]
+    # unique strings, so pickle can't share them between fields
+    wf['operations']['operation'] = [
+        dict(op, id="op-%d" % i, description="%d/%d %s" % (wf_id, i, "x" * 200))
+        for i in range(num_ops)]
+    wf['configurations'] = {"configuration": [
+        {"key": "k%d" % i, "$": "%d/%d %s" % (wf_id, i, "v" * 50)}
+        for i in range(100)]}
+    return wf
+
+
+def fill(storage, docs):
+    cache = EndpointCache(storage=storage, sweep_interval=None)
+    for wf_id, doc in enumerate(docs):
+        cache.set(METHOD, wf_id, doc, ttl=3600, max_entries=len(docs) + 1)
+    return cache
+
+
+def run(storage, docs, hits):
+    # measure memory separately; tracing slows down allocation
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    cache = fill(storage, docs)
+    resident = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del cache
+
+    start = time.time()
+    cache = fill(storage, docs)
+    set_time = time.time() - start
+
+    start = time.time()
+    for i in range(hits):
+        cache.get(METHOD, i % len(docs))
+    hit_time = time.time() - start
+    return set_time / len(docs), hit_time / hits, resident
+
+
+def main(args):
+    docs = [make_workflow(i, args.ops) for i in range(args.entries)]
+    print("%-11s %12s %12s %14s" % ("storage", "set (us)", "hit (us)", "resident (MB)"))
+    for storage in ('pickle', 'frozen', 'compressed'):
+        set_time, hit_time, resident = run(storage, docs, args.hits)
+        print("%-11s %12.1f %12.1f %14.2f" % (storage, set_time * 1e6,
+                                              hit_time * 1e6, resident / 1048576.0))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--entries', type=int, default=200)
+    parser.add_argument('--ops', type=int, default=40,
+                        help="operations per workflow document")
+    parser.add_argument('--hits', type=int, default=5000)
+    main(parser.parse_args())
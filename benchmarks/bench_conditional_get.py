@@ -0,0 +1,52 @@
+"""
+Repeated polling of the components, hosts and agents listings, with and
+without ETag revalidation (conditional GETs) in MHClient.get. Run from the
+repo root:
+
+    python -m benchmarks.bench_conditional_get [--polls 200]
+"""
+
+import time
+from argparse import ArgumentParser
+from pyhorn import MHClient
+from pyhorn.endpoints import InfoEndpoint, ServicesEndpoint, CaptureEndpoint
+from .fake_server import FakeMatterhorn, serve
+
+
+def poll(client, polls):
+    start = time.time()
+    for i in range(polls):
+        InfoEndpoint.components(client)
+        ServicesEndpoint.hosts(client)
+        CaptureEndpoint.agents(client)
+    return time.time() - start
+
+
+def main(args):
+    app = FakeMatterhorn(latency=args.latency, num_hosts=args.hosts,
+                         num_agents=args.agents, num_components=args.components,
+                         etags=True)
+    server, base_url = serve(app)
+    try:
+        for label, cache_enabled in (("full GETs", False),
+                                     ("conditional GETs", True)):
+            client = MHClient(base_url, cache_enabled=cache_enabled)
+            app.request_count = app.bytes_sent = 0
+            elapsed = poll(client, args.polls)
+            print("%-18s %5d requests in %.2fs (%5.2fms each), %8.1fKB of json sent"
+                  % (label, app.request_count, elapsed,
+                     1000 * elapsed / app.request_count, app.bytes_sent / 1024.0))
+            client.close()
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--polls', type=int, default=200)
+    parser.add_argument('--hosts', type=int, default=200)
+    parser.add_argument('--agents', type=int, default=500)
+    parser.add_argument('--components', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="simulated server latency in seconds")
+    main(parser.parse_args())
@@ -0,0 +1,53 @@
+"""
+Request throughput from 32 concurrent threads against the local fake server
+for different MHClient connection pool configurations. Run from the repo root:
+
+    python -m benchmarks.bench_connection_pool [--threads 32] [-n 2000]
+"""
+
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from pyhorn import MHClient
+from .fake_server import FakeMatterhorn, serve
+
+CONFIGS = [
+    ("default pool (maxsize=10)", {}),
+    ("pool_maxsize=threads", {'pool_maxsize': None}),
+    ("pool_maxsize=threads, pool_block", {'pool_maxsize': None, 'pool_block': True}),
+    ("thread-local sessions", {'thread_local_sessions': True}),
+]
+
+
+def run(base_url, n, threads, client_kwargs):
+    if client_kwargs.get('pool_maxsize', 0) is None:
+        client_kwargs = dict(client_kwargs, pool_maxsize=threads)
+    client = MHClient(base_url, cache_enabled=False, **client_kwargs)
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(client.job, range(n)))
+    elapsed = time.time() - start
+    client.close()
+    return elapsed
+
+
+def main(args):
+    app = FakeMatterhorn(latency=args.latency)
+    server, base_url = serve(app)
+    try:
+        for label, client_kwargs in CONFIGS:
+            app.connection_count = 0
+            elapsed = run(base_url, args.n, args.threads, client_kwargs)
+            print("%-36s %5d requests in %.2fs (%4.0f req/s), %4d connections opened"
+                  % (label, args.n, elapsed, args.n / elapsed, app.connection_count))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', type=int, default=2000, help="number of requests")
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help="simulated server latency in seconds")
+    main(parser.parse_args())
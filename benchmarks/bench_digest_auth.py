@@ -0,0 +1,57 @@
+"""
+Count HTTP round-trips and latency for authenticated requests against the
+local fake server with digest auth enabled. Run from the repo root:
+
+    python -m benchmarks.bench_digest_auth [-n 200] [--latency 0.01]
+"""
+
+import time
+from argparse import ArgumentParser
+from requests.auth import HTTPDigestAuth
+from pyhorn import MHClient
+from .fake_server import FakeMatterhorn, serve
+
+
+class _FreshAuthClient(MHClient):
+    """
+    Reproduces the old behavior of building a new auth handler per request
+    """
+    def _http_auth(self):
+        return HTTPDigestAuth(self.user, self.passwd)
+
+
+def run(client_class, app, base_url, n):
+    app.request_count = 0
+    app.challenge_count = 0
+    client = client_class(base_url, 'matterhorn_system_account', 'CHANGE_ME',
+                          cache_enabled=False)
+    start = time.time()
+    for i in range(n):
+        client.job(i)
+    elapsed = time.time() - start
+    client.close()
+    return elapsed, app.request_count, app.challenge_count
+
+
+def main(args):
+    app = FakeMatterhorn(latency=args.latency,
+                         digest_user='matterhorn_system_account',
+                         digest_passwd='CHANGE_ME')
+    server, base_url = serve(app)
+    try:
+        for label, client_class in [("new auth per request", _FreshAuthClient),
+                                    ("per-client digest state", MHClient)]:
+            elapsed, requests_, challenges = run(client_class, app, base_url, args.n)
+            print("%-26s %4d calls: %4d HTTP requests, %4d challenges, "
+                  "%.1fms/call" % (label, args.n, requests_, challenges,
+                                   1000 * elapsed / args.n))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', type=int, default=200, help="number of requests")
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help="simulated server latency in seconds")
+    main(parser.parse_args())
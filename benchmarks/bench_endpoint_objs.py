@@ -0,0 +1,86 @@
+"""
+Construction time and memory of large listings wrapped in endpoint objects,
+comparing the previous EndpointObj, which copied every response dict with
+normalized keys and allocated a relation stash up front, with the current
+slotted one. Run from the repo root:
+
+    python -m benchmarks.bench_endpoint_objs [--objects 100000]
+"""
+
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pyhorn.endpoints import UserAction, WorkflowOperation
+from .fake_server import _workflow
+
+
+class LegacyEndpointObj(object):
+    """
+    The previous implementation
+    """
+
+    def __init__(self, raw_data, client):
+        self._raw = dict((k.replace('-','_'), v) for k,v in raw_data.items())
+        self._property_stash = {}
+        self.client = client
+
+    def __getattr__(self, attribute):
+        if attribute in self._raw:
+            return self._raw[attribute]
+        raise AttributeError(attribute)
+
+
+def user_actions(n):
+    return [{"id": i, "type": "HEARTBEAT", "mediapackageId": "mp-%d" % (i % 500),
+             "created": "2015-10-30T00:30:00-04:00", "sessionId": "s-%d" % i,
+             "inpoint": i % 3600, "outpoint": i % 3600 + 10, "isPlaying": True}
+            for i in range(n)]
+
+
+def operations(n):
+    ops = []
+    wf_id = 0
+    while len(ops) < n:
+        ops.extend(_workflow(wf_id)['operations']['operation'])
+        wf_id += 1
+    return ops[:n]
+
+
+def wrap(class_, data):
+    return [class_(x, None) for x in data]
+
+
+def run(class_, data):
+    tracemalloc.start()
+    objs = wrap(class_, data)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objs
+
+    start = time.time()
+    objs = wrap(class_, data)
+    elapsed = time.time() - start
+    # read a couple of attributes of each
+    start = time.time()
+    for obj in objs:
+        obj.id
+        obj.client
+    access = time.time() - start
+    return elapsed, access, size
+
+
+def main(args):
+    print("%-28s %12s %12s %12s" % ("", "wrap (s)", "access (s)", "memory (MB)"))
+    for label, class_, data in (
+            ("UserAction", UserAction, user_actions(args.objects)),
+            ("WorkflowOperation", WorkflowOperation, operations(args.objects))):
+        for impl, cls in (("previous", LegacyEndpointObj), ("slotted", class_)):
+            elapsed, access, size = run(cls, data)
+            print("%-28s %12.3f %12.3f %12.2f" % (
+                "%s, %s" % (label, impl), elapsed, access, size / 1048576.0))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--objects', type=int, default=100000)
+    main(parser.parse_args())
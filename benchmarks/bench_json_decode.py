@@ -0,0 +1,64 @@
+"""
+Per-endpoint decode time of response bodies: requests' ``resp.json()`` (a
+text decode followed by the stdlib parser) against each json decoder from
+``pyhorn.decoders`` that's installed, given the raw bytes. The bodies are
+the fake server's responses for each endpoint. Run from the repo root:
+
+    python -m benchmarks.bench_json_decode [--repeat 200]
+"""
+
+import json
+import time
+import requests
+from argparse import ArgumentParser
+from pyhorn import decoders
+from .fake_server import FakeMatterhorn
+
+ENDPOINTS = [
+    ('workflow/instance', '/workflow/instance/1.json', {}),
+    ('workflow/instances', '/workflow/instances.json', {'count': ['100']}),
+    ('episode/episode', '/episode/episode.json', {'limit': ['100']}),
+    ('usertracking/actions', '/usertracking/actions.json', {'limit': ['1000']}),
+    ('capture-admin/agents', '/capture-admin/agents.json', {}),
+    ('services/hosts', '/services/hosts.json', {}),
+    ('info/components', '/info/components.json', {}),
+]
+
+
+def response(body):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.headers['Content-Type'] = 'application/json'
+    resp._content = body
+    return resp
+
+
+def timed(decode, body, repeat):
+    start = time.time()
+    for i in range(repeat):
+        decode(body)
+    return (time.time() - start) / repeat
+
+
+def main(args):
+    app = FakeMatterhorn(num_agents=500, num_hosts=200, num_components=300)
+    contenders = [('resp.json()', lambda body: response(body).json())]
+    for name in ('json', 'orjson', 'simdjson', 'ujson'):
+        try:
+            contenders.append((name, decoders.get_decoder(name).decode))
+        except ValueError:
+            print("%s not installed" % name)
+
+    print("%-22s %9s" % ("endpoint", "KB") +
+          "".join("%14s" % name for name, decode in contenders))
+    for label, path, query in ENDPOINTS:
+        body = json.dumps(app.route(path, query)).encode('utf-8')
+        times = [timed(decode, body, args.repeat) for name, decode in contenders]
+        print("%-22s %9.1f" % (label, len(body) / 1024.0) +
+              "".join("%12.1fus" % (t * 1e6) for t in times))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,76 @@
+"""
+Memory kept by a large ``workflows()`` pull for reporting, with and without
+a ``fields`` projection down to the id, state, mediapackage id and operation
+timing, and with the projection applied to a ``stream_workflows()`` pull. Reports the time taken and the client's traced memory still held by
+the returned workflows, and at peak. The server runs in a separate process so
+its memory isn't counted. Run from the repo root:
+
+    python -m benchmarks.bench_projection [--workflows 2000]
+"""
+
+import time
+import tracemalloc
+import multiprocessing
+from argparse import ArgumentParser
+from pyhorn import MHClient
+from .fake_server import FakeMatterhorn, serve
+
+FIELDS = ['id', 'state', 'mediapackage.id', 'operations.operation.id',
+          'operations.operation.started', 'operations.operation.completed']
+
+
+def run_server(conn, num_workflows, num_operations, num_configurations):
+    app = FakeMatterhorn(num_workflows=num_workflows,
+                         num_operations=num_operations,
+                         num_configurations=num_configurations)
+    server, base_url = serve(app)
+    conn.send(base_url)
+    # wait for the parent to finish
+    conn.recv()
+    server.shutdown()
+
+
+def main(args):
+    conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(
+        target=run_server,
+        args=(child_conn, args.workflows, args.operations, args.configurations))
+    server.start()
+    base_url = conn.recv()
+    try:
+        client = MHClient(base_url, cache_enabled=False)
+        count = args.workflows
+        runs = [
+            ("all fields", lambda: client.workflows(count=count)),
+            ("fields", lambda: client.workflows(count=count, fields=FIELDS)),
+            ("streamed, fields",
+             lambda: list(client.stream_workflows(count=count, fields=FIELDS))),
+        ]
+        for label, pull in runs:
+            # timed separately; tracing slows down allocation
+            start = time.time()
+            wfs = pull()
+            elapsed = time.time() - start
+            del wfs
+            tracemalloc.start()
+            wfs = pull()
+            durations = sum(wf.duration() for wf in wfs)
+            held, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del wfs
+            print("%-17s %.2fs, held %7.2fMB, peak %7.2fMB (total duration %d)"
+                  % (label, elapsed, held / 1048576.0, peak / 1048576.0, durations))
+        client.close()
+    finally:
+        conn.send(None)
+        server.join()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--workflows', type=int, default=2000)
+    parser.add_argument('--operations', type=int, default=40,
+                        help="operations per workflow")
+    parser.add_argument('--configurations', type=int, default=100,
+                        help="configuration entries per workflow")
+    main(parser.parse_args())
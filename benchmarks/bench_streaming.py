@@ -0,0 +1,69 @@
+"""
+A large workflow listing fetched with ``workflows()``, which parses the whole
+response before returning, and with ``stream_workflows()``, which yields each
+workflow as soon as it has been downloaded. Reports the time to the first and
+last workflow and the client's peak traced memory. The server runs in a
+separate process so its memory isn't counted. Run from the repo root:
+
+    python -m benchmarks.bench_streaming [--workflows 5000] [--bandwidth 20]
+"""
+
+import time
+import tracemalloc
+import multiprocessing
+from argparse import ArgumentParser
+from pyhorn import MHClient
+from .fake_server import FakeMatterhorn, serve
+
+
+def run_server(conn, num_workflows, bandwidth):
+    app = FakeMatterhorn(num_workflows=num_workflows, bandwidth=bandwidth)
+    server, base_url = serve(app)
+    conn.send(base_url)
+    # wait for the parent to finish
+    conn.recv()
+    server.shutdown()
+
+
+def consume(workflows):
+    start = time.time()
+    first = None
+    ops = 0
+    for wf in workflows():
+        if first is None:
+            first = time.time() - start
+        ops += len(wf.raw_get('operations.operation'))
+    return first, time.time() - start, ops
+
+
+def main(args):
+    conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(
+        target=run_server,
+        args=(child_conn, args.workflows, args.bandwidth * 1024 * 1024))
+    server.start()
+    base_url = conn.recv()
+    try:
+        client = MHClient(base_url, cache_enabled=False)
+        count = args.workflows
+        for label, workflows in (
+                ("workflows()", lambda: client.workflows(count=count)),
+                ("stream_workflows()", lambda: client.stream_workflows(count=count))):
+            tracemalloc.start()
+            first, total, ops = consume(workflows)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("%-20s first workflow %6.2fs, all %6.2fs, %d ops, peak %7.2fMB"
+                  % (label, first, total, ops, peak / 1048576.0))
+        client.close()
+    finally:
+        conn.send(None)
+        server.join()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--workflows', type=int, default=5000)
+    parser.add_argument('--bandwidth', type=float, default=20,
+                        help="simulated server bandwidth in MB/s")
+    main(parser.parse_args())
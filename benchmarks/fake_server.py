@@ -0,0 +1,282 @@
+"""
+benchmarks.fake_server
+~~~~~~~~~~~~~~
+A local stand-in for a Matterhorn admin node. Serves canned, deterministic
+json for the endpoints pyhorn wraps, with an optional per-request delay to
+simulate network/server latency.
+"""
+
+import re
+import json
+import time
+import uuid
+import hashlib
+import threading
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qs
+
+_write_size = 65536
+
+
+def _workflow(wf_id, state="RUNNING", num_operations=5, num_configurations=0):
+    wf = {
+        "id": wf_id,
+        "state": state,
+        "mediapackage": {
+            "id": "mp-%d" % wf_id,
+            "title": "Lecture %d" % wf_id,
+            "start": "2015-10-30T00:00:00-04:00",
+            "duration": 3600000,
+        },
+        "operations": {
+            "operation": [
+                {"id": "op-%d" % i, "state": state,
+                 "job": wf_id * 100 + i,
+                 "started": 1000 * i, "completed": 1000 * i + 500}
+                for i in range(num_operations)
+            ]
+        },
+    }
+    if num_configurations:
+        wf["configurations"] = {"configuration": [
+            {"key": "config-%d" % i, "$": "value %d of workflow %d" % (i, wf_id)}
+            for i in range(num_configurations)]}
+    return wf
+
+
+def _job(job_id, status="QUEUED"):
+    return {"id": job_id, "status": status, "parentJobId": -1}
+
+
+def _episode(mp_id):
+    return {"id": mp_id, "mediapackage": {"id": mp_id, "duration": 3600000,
+                                          "start": "2015-10-30T00:00:00-04:00"}}
+
+
+class FakeMatterhorn(object):
+    """
+    Routes request paths to response data. ``num_workflows``, ``num_episodes``
+    and ``num_actions`` control the size of the paged listings, ``num_hosts``,
+    ``num_agents`` and ``num_components`` that of the unpaged ones. With
+    ``etags`` on, responses carry an ETag and matching If-None-Match requests
+    get a 304. ``bandwidth`` (bytes per second) throttles response bodies.
+    ``num_operations`` and ``num_configurations`` set the size of each
+    workflow document.
+    """
+
+    def __init__(self, latency=0.0, num_workflows=500, num_episodes=500,
+                 num_actions=2000, digest_user=None, digest_passwd=None,
+                 nonce_ttl=60, num_hosts=10, num_agents=50, num_components=2,
+                 etags=False, bandwidth=None, num_operations=5,
+                 num_configurations=0):
+        self.latency = latency
+        self.digest_user = digest_user
+        self.digest_passwd = digest_passwd
+        self.nonce_ttl = nonce_ttl
+        self.challenge_count = 0
+        self._nonces = {}
+        self.num_workflows = num_workflows
+        self.num_episodes = num_episodes
+        self.num_actions = num_actions
+        self.num_hosts = num_hosts
+        self.num_agents = num_agents
+        self.num_components = num_components
+        self.etags = etags
+        self.bandwidth = bandwidth
+        self.num_operations = num_operations
+        self.num_configurations = num_configurations
+        self.bytes_sent = 0
+        self.request_count = 0
+        self.connection_count = 0
+        self._count_lock = threading.Lock()
+
+    def _workflow(self, wf_id):
+        return _workflow(wf_id, num_operations=self.num_operations,
+                         num_configurations=self.num_configurations)
+
+    def route(self, path, query):
+        m = re.match(r'^/workflow/instance/(\d+)\.json$', path)
+        if m:
+            return {"workflow": self._workflow(int(m.group(1)))}
+        if path == '/workflow/instances.json':
+            count = int(query.get('count', [0])[0]) or self.num_workflows
+            start = int(query.get('startPage', [0])[0]) * count
+            wfs = [self._workflow(i) for i in
+                   range(start, min(start + count, self.num_workflows))]
+            return {"workflows": {"totalCount": self.num_workflows,
+                                  "workflow": wfs}}
+        m = re.match(r'^/services/job/(\d+)/children\.json$', path)
+        if m:
+            job_id = int(m.group(1))
+            return {"jobs": {"job": [_job(job_id * 10 + i) for i in range(3)]}}
+        m = re.match(r'^/services/job/(\d+)\.json$', path)
+        if m:
+            return {"job": _job(int(m.group(1)), "RUNNING")}
+        m = re.match(r'^/capture-admin/agents/(.+)\.json$', path)
+        if m:
+            return {"agent-state-update": {"name": m.group(1), "state": "idle"}}
+        if path == '/capture-admin/agents.json':
+            return {"agents": {"agent": [{"name": "ca%03d" % i, "state": "idle"}
+                                         for i in range(self.num_agents)]}}
+        if path in ('/episode/episode.json', '/search/episode.json'):
+            if 'id' in query:
+                return {"search-results": {"result": _episode(query['id'][0])}}
+            limit = int(query.get('limit', [10])[0]) or self.num_episodes
+            offset = int(query.get('offset', [0])[0])
+            eps = [_episode("mp-%d" % i) for i in
+                   range(offset, min(offset + limit, self.num_episodes))]
+            return {"search-results": {"total": self.num_episodes, "result": eps}}
+        if path == '/usertracking/actions.json':
+            limit = int(query.get('limit', [0])[0]) or self.num_actions
+            offset = int(query.get('offset', [0])[0])
+            actions = [{"id": i, "type": "HEARTBEAT",
+                        "mediapackageId": "mp-%d" % (i % self.num_episodes),
+                        "created": "2015-10-30T00:30:00-04:00"}
+                       for i in range(offset, min(offset + limit, self.num_actions))]
+            return {"actions": {"total": self.num_actions, "action": actions}}
+        if path == '/services/hosts.json':
+            return {"hosts": {"host": [{"base_url": "http://worker%02d" % i,
+                                        "maintenance": False}
+                                       for i in range(self.num_hosts)]}}
+        if path == '/services/services.json':
+            return {"services": {"service": [{"type": "compose"}]}}
+        if path == '/services/statistics.json':
+            return {"statistics": {"service": [
+                {"queued": 1, "running": 2,
+                 "serviceRegistration": {"type": "compose",
+                                         "host": "http://worker%02d" % i}}
+                for i in range(10)]}}
+        if path == '/info/components.json':
+            return {"rest": [{"path": "/component%d" % i,
+                              "version": "1.6.1",
+                              "description": "Component %d REST endpoint" % i}
+                             for i in range(self.num_components)]}
+        if path == '/info/me.json':
+            return {"username": "matterhorn_system_account"}
+        return None
+
+    def _md5(self, value):
+        return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+    def new_challenge(self, stale=False):
+        nonce = uuid.uuid4().hex
+        with self._count_lock:
+            self._nonces[nonce] = time.time() + self.nonce_ttl
+            self.challenge_count += 1
+        return ('Digest realm="matterhorn", qop="auth", nonce="%s", '
+                'opaque="pyhorn", stale=%s' % (nonce, stale and "true" or "false"))
+
+    def check_digest(self, method, header):
+        """
+        :return: (authorized, stale) tuple
+        """
+        if not header or not header.lower().startswith('digest '):
+            return False, False
+        fields = dict((k, v1 or v2) for k, v1, v2 in
+                      re.findall(r'(\w+)=(?:"([^"]*)"|([^,\s]*))', header[7:]))
+        expires = self._nonces.get(fields.get('nonce'))
+        if expires is None or expires < time.time():
+            return False, True
+        ha1 = self._md5("%s:matterhorn:%s" % (self.digest_user, self.digest_passwd))
+        ha2 = self._md5("%s:%s" % (method, fields.get('uri')))
+        expected = self._md5(":".join([ha1, fields['nonce'], fields.get('nc', ''),
+                                       fields.get('cnonce', ''), 'auth', ha2]))
+        return fields.get('username') == self.digest_user \
+            and fields.get('response') == expected, False
+
+    def handler_class(self):
+        app = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+                with app._count_lock:
+                    app.connection_count += 1
+
+            def challenged(self):
+                if app.digest_user is None:
+                    return False
+                authorized, stale = app.check_digest(
+                    self.command, self.headers.get('Authorization'))
+                if authorized:
+                    return False
+                self.send_response(401)
+                self.send_header('WWW-Authenticate', app.new_challenge(stale))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return True
+
+            def do_GET(self):
+                with app._count_lock:
+                    app.request_count += 1
+                if app.latency:
+                    time.sleep(app.latency)
+                if self.challenged():
+                    return
+                url = urlparse(self.path)
+                data = app.route(url.path, parse_qs(url.query))
+                if data is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = json.dumps(data).encode('utf-8')
+                etag = None
+                if app.etags:
+                    etag = '"%s"' % hashlib.md5(body).hexdigest()
+                    if self.headers.get('If-None-Match') == etag:
+                        self.send_response(304)
+                        self.send_header('ETag', etag)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                if app.bandwidth:
+                    for i in range(0, len(body), _write_size):
+                        self.wfile.write(body[i:i + _write_size])
+                        time.sleep(_write_size / float(app.bandwidth))
+                else:
+                    self.wfile.write(body)
+                with app._count_lock:
+                    app.bytes_sent += len(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self.rfile.read(length)
+                if self.challenged():
+                    return
+                self.send_response(204)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class _ThreadingServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(app=None, host='127.0.0.1', port=0):
+    """
+    Start a fake server on a background thread.
+    :return: (server, base_url) tuple; call ``server.shutdown()`` when done
+    """
+    app = app or FakeMatterhorn()
+    server = _ThreadingServer((host, port), app.handler_class())
+    server.app = app
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server, "http://%s:%d" % server.server_address
@@ -13,12 +13,9 @@ def main(args):
 
     mh = MHClient(args.host, args.username, args.password)
 
-    # get the running workflows; high "count" value to make sure we get all
-    running_wfs = mh.workflows(state="RUNNING", count=1000)
-
-    # then get their running operations
+    # get the running workflows and their running operations, one page at a time
     running_ops = []
-    for wf in running_wfs:
+    for wf in mh.iter_workflows(state="RUNNING"):
         running_ops.extend(filter(
             lambda x: x.state in ["RUNNING","WAITING"],
             wf.operations
@@ -28,6 +25,9 @@ def main(args):
     if args.type is not None:
         running_ops = filter(lambda x: x.id in args.type, running_ops)
 
+    # fetch the operations' jobs and their child jobs concurrently
+    running_ops = mh.resolve(running_ops, 'job.children')
+
     # now get any queued child jobs of those operations
     queued_jobs = []
     for op in running_ops:
@@ -1,3 +1,7 @@
 __version__ = '0.9.0'
 
+import six
 from .client import MHClient, MHClientHTTPError
+
+if six.PY3:
+    from .aio import AsyncMHClient
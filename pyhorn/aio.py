@@ -0,0 +1,213 @@
+"""
+pyhorn.aio
+~~~~~~~~~~~~~~
+asyncio interface to the main API client class (python 3 only)
+"""
+
+import asyncio
+import functools
+import itertools
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+from .client import MHClient, _default_page_size, _default_read_ahead
+
+_default_max_workers = 16
+# streamed items handed to the event loop per worker thread hop
+_default_stream_batch = 100
+
+
+def _take(items, n):
+    return list(itertools.islice(items, n))
+
+def _close(items, pending):
+    # a generator can't be closed while another thread is advancing it
+    if pending is not None:
+        futures.wait([pending])
+    items.close()
+
+
+class AsyncMHClient(object):
+    """
+    Mirrors the ``MHClient`` methods as coroutines. Requests are dispatched to
+    a bounded pool of worker threads so that a single event loop can keep
+    many of them in flight at once. The wrapped ``MHClient`` (and therefore
+    its ``EndpointCache``) is shared by every request.
+    """
+
+    def __init__(self, base_url, user=None, passwd=None, timeout=None,
+                 cache_enabled=True, max_workers=None, client=None):
+        self.max_workers = max_workers or _default_max_workers
+        self._owns_client = client is None
+        if client is None:
+            # one pooled connection per worker thread
+            client = MHClient(base_url, user, passwd, timeout, cache_enabled,
+                              pool_maxsize=self.max_workers)
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    @property
+    def base_url(self):
+        return self.client.base_url
+
+    @property
+    def cache(self):
+        return self.client.cache
+
+    @property
+    def cache_enabled(self):
+        return self.client.cache_enabled
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        if self._owns_client:
+            self.client.close()
+
+    def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self._executor,
+                                    functools.partial(func, *args, **kwargs))
+
+    async def _iterate(self, func, batch_size, *args, **kwargs):
+        """
+        Async generator over the items of one of the ``MHClient`` generator
+        methods. The generator is created and advanced on the worker threads,
+        ``batch_size`` items per hop, and closed if iteration stops early.
+        """
+        items = await self._run(func, *args, **kwargs)
+        pending = None
+        try:
+            while True:
+                pending = self._executor.submit(_take, items, batch_size)
+                batch = await asyncio.wrap_future(pending)
+                for item in batch:
+                    yield item
+                if len(batch) < batch_size:
+                    return
+        finally:
+            try:
+                self._executor.submit(_close, items, pending)
+            except RuntimeError:
+                # the client was closed first, e.g. on leaving ``async with``
+                # before the generator was finalized
+                _close(items, pending)
+
+    async def endpoints(self):
+        return await self._run(self.client.endpoints)
+
+    async def me(self):
+        return await self._run(self.client.me)
+
+    async def user_actions(self, **kwargs):
+        return await self._run(self.client.user_actions, **kwargs)
+
+    def stream_user_actions(self, batch_size=_default_stream_batch, **kwargs):
+        """
+        Async generator version of ``MHClient.stream_user_actions``; the
+        response is read ``batch_size`` actions at a time
+        """
+        return self._iterate(self.client.stream_user_actions, batch_size,
+                             **kwargs)
+
+    def iter_user_actions(self, page_size=_default_page_size,
+                          read_ahead=_default_read_ahead, **kwargs):
+        """
+        Async generator version of ``MHClient.iter_user_actions``
+        """
+        return self._iterate(self.client.iter_user_actions, page_size,
+                             page_size, read_ahead, **kwargs)
+
+    async def workflows(self, **kwargs):
+        return await self._run(self.client.workflows, **kwargs)
+
+    def stream_workflows(self, batch_size=_default_stream_batch, **kwargs):
+        """
+        Async generator version of ``MHClient.stream_workflows``; the
+        response is read ``batch_size`` workflows at a time
+        """
+        return self._iterate(self.client.stream_workflows, batch_size,
+                             **kwargs)
+
+    def iter_workflows(self, page_size=_default_page_size,
+                       read_ahead=_default_read_ahead, **kwargs):
+        """
+        Async generator version of ``MHClient.iter_workflows``, e.g.
+        ``async for wf in aclient.iter_workflows(state="RUNNING")``
+        """
+        return self._iterate(self.client.iter_workflows, page_size,
+                             page_size, read_ahead, **kwargs)
+
+    async def workflow(self, instance_id):
+        return await self._run(self.client.workflow, instance_id)
+
+    async def episodes(self, **kwargs):
+        return await self._run(self.client.episodes, **kwargs)
+
+    def iter_episodes(self, page_size=_default_page_size,
+                      read_ahead=_default_read_ahead, **kwargs):
+        """
+        Async generator version of ``MHClient.iter_episodes``
+        """
+        return self._iterate(self.client.iter_episodes, page_size,
+                             page_size, read_ahead, **kwargs)
+
+    async def episode(self, episode_id):
+        return await self._run(self.client.episode, episode_id)
+
+    async def search_episodes(self, **kwargs):
+        return await self._run(self.client.search_episodes, **kwargs)
+
+    def iter_search_episodes(self, page_size=_default_page_size,
+                             read_ahead=_default_read_ahead, **kwargs):
+        """
+        Async generator version of ``MHClient.iter_search_episodes``
+        """
+        return self._iterate(self.client.iter_search_episodes, page_size,
+                             page_size, read_ahead, **kwargs)
+
+    async def search_episode(self, episode_id):
+        return await self._run(self.client.search_episode, episode_id)
+
+    async def agents(self, fields=None):
+        return await self._run(self.client.agents, fields)
+
+    async def agent(self, agent_name):
+        return await self._run(self.client.agent, agent_name)
+
+    async def hosts(self, prefetch=None):
+        return await self._run(self.client.hosts, prefetch)
+
+    async def job(self, job_id):
+        return await self._run(self.client.job, job_id)
+
+    async def statistics(self):
+        return await self._run(self.client.statistics)
+
+    async def resolve(self, objects, *paths, **kwargs):
+        return await self._run(self.client.resolve, objects, *paths, **kwargs)
+
+    async def related(self, obj, name):
+        """
+        Awaitable access to a lazy (``_ref_property``) relation of an
+        endpoint object, e.g. ``await aclient.related(wf, 'job')``. The
+        result is stashed on the object as with plain attribute access.
+        :param obj: an ``EndpointObj`` instance
+        :param name: name of the relation property
+        :return: the dereferenced object or list of objects
+        """
+        return await self._run(getattr, obj, name)
+
+    async def get(self, path, params=None, extra_headers=None):
+        return await self._run(self.client.get, path, params, extra_headers)
+
+    async def post(self, path, data=None, extra_headers=None, invalidate_tags=None):
+        return await self._run(self.client.post, path, data, extra_headers,
+                               invalidate_tags)
+
+    def clear_cache(self):
+        self.client.clear_cache()
@@ -6,11 +6,17 @@ Defines the main API client class
 
 import os
 import six
+import weakref
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPDigestAuth
 from .endpoints import *
-from .endpoints.cache import EndpointCache
-from .utils import default_headers
+from .endpoints.base import resolve_refs, projection
+from .endpoints.cache import EndpointCache, prime
+from .endpoints.backends import SQLiteCacheBackend
+from .decoders import get_decoder
+from .utils import default_headers, iter_pages, iter_json_items
 
 if six.PY3:
     from urllib.parse import urljoin
@@ -18,11 +24,66 @@ else:
     from urlparse import urljoin
 
 _default_timeout = 5
-_session = requests.Session()
+_default_page_size = 100
+_default_read_ahead = 2
+_default_max_workers = 8
+_default_pool_connections = 10
+_default_pool_maxsize = 10
+_default_chunk_size = 65536
+
+# large, rarely changing responses that are revalidated with a conditional GET
+# instead of being downloaded again
+_conditional_get_paths = frozenset([
+    'info/components.json',
+    'services/hosts.json',
+    'capture-admin/agents.json',
+])
+# how long validators are kept since the response was last confirmed current
+_conditional_get_ttl = 3600
 
 class MHClientHTTPError(Exception):
     pass
 
+class _DigestAuth(HTTPDigestAuth):
+    """
+    Digest auth handler that is kept for the lifetime of the client. The
+    parent class keeps the server nonce and nonce count per thread, so after
+    the first challenge requests carry a valid Authorization header up front.
+    A stale or expired nonce gets a fresh 401 challenge, which is answered
+    transparently. ``challenges`` counts those extra round-trips.
+    """
+
+    def __init__(self, username, password, challenges=0):
+        super(_DigestAuth, self).__init__(username, password)
+        self.challenges = challenges
+        self._challenges_lock = threading.Lock()
+
+    def handle_401(self, r, **kwargs):
+        resp = super(_DigestAuth, self).handle_401(r, **kwargs)
+        if resp is not r:
+            with self._challenges_lock:
+                self.challenges += 1
+        return resp
+
+class _SessionHolder(object):
+    """
+    Kept in a thread-local; it's dropped, and can be weakly referenced, once
+    its thread ends
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+def _session_releaser(sessions, lock, session):
+    # doesn't reference the client, so a thread's session never keeps it alive
+    def release(ref):
+        with lock:
+            if sessions.pop(session, False) is False:
+                # already closed by close()
+                return
+        session.close()
+    return release
+
 def handle_http_exceptions(callbacks={}):
     def wrapper(f):
         def newfunc(*args, **kwargs):
@@ -46,14 +107,63 @@ def handle_http_exceptions(callbacks={}):
 
 class MHClient(object):
 
-    def __init__(self, base_url, user=None, passwd=None, timeout=None, cache_enabled=True):
+    def __init__(self, base_url, user=None, passwd=None, timeout=None, cache_enabled=True,
+                 pool_connections=_default_pool_connections,
+                 pool_maxsize=_default_pool_maxsize, pool_block=False,
+                 thread_local_sessions=False, cache_max_bytes=None,
+                 cache_storage=None, cache_backend=None,
+                 cache_list_items=False, cache_listings=False,
+                 json_decoder=None):
+        """
+        :param pool_connections: number of per-host connection pools to keep
+        :param pool_maxsize: max number of connections kept open to each host
+        :param pool_block: if True, never open more than ``pool_maxsize``
+                           connections to a host; requests wait for a free one
+        :param thread_local_sessions: give each thread its own session (and
+                                      connection pools) instead of sharing one
+        :param cache_max_bytes: optional limit on the total size of cached
+                                responses
+        :param cache_storage: how cached responses are stored: 'pickle'
+                              (default), 'frozen' or 'compressed'
+        :param cache_backend: optional shared second-tier cache; a
+                              CacheBackend instance or the path of a SQLite
+                              database file
+        :param cache_list_items: also cache each workflow/episode returned by
+                                 the list methods as if it had been fetched
+                                 on its own, e.g. via ``workflow(id)``
+        :param cache_listings: also cache (for a few seconds) the responses of
+                               the workflows, services, hosts, statistics and
+                               agents listings
+        :param json_decoder: how responses are decoded: 'json', 'orjson',
+                             'simdjson', 'ujson' or a decoder instance from
+                             ``.decoders``; by default the fastest installed
+        """
         self.base_url = base_url
         self.user = user
         self.passwd = passwd
         self.timeout = timeout or _default_timeout
         self.default_headers = default_headers(self.user and self.passwd)
         self.cache_enabled = cache_enabled
-        self.cache = EndpointCache()
+        self.cache_list_items = cache_list_items
+        self.cache_listings = cache_listings
+        self.json_decoder = get_decoder(json_decoder)
+        if isinstance(cache_backend, six.string_types):
+            cache_backend = SQLiteCacheBackend(cache_backend)
+        self.cache = EndpointCache(max_bytes=cache_max_bytes,
+                                   storage=cache_storage,
+                                   backend=cache_backend)
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.thread_local_sessions = thread_local_sessions
+        # session -> weakref to the holder of a thread's session
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        self._local = threading.local()
+        self._auth = None
+        self._auth_lock = threading.Lock()
+        if not thread_local_sessions:
+            self._shared_session = self._new_session()
 
     @handle_http_exceptions()
     def endpoints(self):
@@ -72,14 +182,86 @@ class MHClient(object):
         return InfoEndpoint.me(self)
 
     @handle_http_exceptions()
-    def user_actions(self, **kwargs):
+    def user_actions(self, prefetch=None, fields=None, **kwargs):
+        """
+        :param fields: keep only these dotted paths of each action's data,
+                       e.g. ``['id', 'mediapackageId']``, to save memory
+        """
         actions = UserTrackingEndpoint.user_actions(self, **kwargs)
-        return [UserAction(x, self) for x in actions]
+        return self._prefetch(self._wrap(actions, UserAction, fields), prefetch)
+
+    @handle_http_exceptions()
+    def stream_user_actions(self, fields=None, **kwargs):
+        """
+        Like ``user_actions``, but the response is parsed as it arrives and
+        each action is yielded as soon as it's complete, so a large listing
+        is never held in memory all at once
+        :return: generator of ``UserAction`` objects
+        """
+        actions = UserTrackingEndpoint.stream_user_actions(self, **kwargs)
+        return self._wrap_stream(actions, UserAction, fields=fields)
+
+    def iter_user_actions(self, page_size=_default_page_size,
+                          read_ahead=_default_read_ahead, fields=None, **kwargs):
+        """
+        Generator over every user action matching the ``kwargs`` filters,
+        requested ``page_size`` at a time via ``limit``/``offset``.
+        :param page_size: number of actions per request
+        :param read_ahead: max number of prefetched pages held in memory
+        :return: generator of ``UserAction`` objects
+        """
+        pages = self._iter_offset_pages(UserTrackingEndpoint.user_actions,
+                                        page_size, read_ahead, kwargs)
+        prune = fields and projection(fields)
+        for page in pages:
+            for action in self._wrap(page, UserAction, prune=prune):
+                yield action
 
     @handle_http_exceptions()
-    def workflows(self, **kwargs):
+    def workflows(self, prefetch=None, fields=None, **kwargs):
+        """
+        :param fields: keep only these dotted paths of each workflow's data,
+                       e.g. ``['id', 'state', 'mediapackage.id']``, to save
+                       memory
+        """
         wfs = WorkflowEndpoint.instances(self, **kwargs)
-        return [Workflow(x, self) for x in wfs]
+        if not kwargs.get('compact'):
+            self._cache_items(WorkflowEndpoint.instance, wfs)
+        return self._prefetch(self._wrap(wfs, Workflow, fields), prefetch)
+
+    @handle_http_exceptions()
+    def stream_workflows(self, fields=None, **kwargs):
+        """
+        Like ``workflows``, but the response is parsed as it arrives and each
+        workflow is yielded as soon as it's complete, so a large listing is
+        never held in memory all at once. The listing itself isn't cached.
+        :return: generator of ``Workflow`` objects
+        """
+        wfs = WorkflowEndpoint.stream_instances(self, **kwargs)
+        return self._wrap_stream(wfs, Workflow, None if kwargs.get('compact')
+                                 else WorkflowEndpoint.instance, fields)
+
+    def iter_workflows(self, page_size=_default_page_size,
+                       read_ahead=_default_read_ahead, fields=None, **kwargs):
+        """
+        Generator over every workflow instance matching the ``kwargs`` filters.
+        Results are requested ``page_size`` at a time via ``startPage``, with
+        upcoming pages prefetched on a background thread.
+        :param page_size: number of workflows per request (the ``count`` param)
+        :param read_ahead: max number of prefetched pages held in memory
+        :return: generator of ``Workflow`` objects
+        """
+        @handle_http_exceptions()
+        def fetch_page(page_num):
+            return WorkflowEndpoint.instances(self, **dict(kwargs,
+                                              count=page_size, startPage=page_num))
+
+        prune = fields and projection(fields)
+        for page in iter_pages(fetch_page, page_size, read_ahead):
+            if not kwargs.get('compact'):
+                self._cache_items(WorkflowEndpoint.instance, page)
+            for wf in self._wrap(page, Workflow, prune=prune):
+                yield wf
 
     @handle_http_exceptions()
     def workflow(self, instance_id):
@@ -87,9 +269,30 @@ class MHClient(object):
         return Workflow(wf, self)
 
     @handle_http_exceptions()
-    def episodes(self, **kwargs):
+    def episodes(self, prefetch=None, fields=None, **kwargs):
+        """
+        :param fields: keep only these dotted paths of each episode's data
+        """
         eps = EpisodeEndpoint.episodes(self, **kwargs)
-        return [Episode(x, self) for x in eps]
+        self._cache_items(EpisodeEndpoint.episode, eps)
+        return self._prefetch(self._wrap(eps, Episode, fields), prefetch)
+
+    def iter_episodes(self, page_size=_default_page_size,
+                      read_ahead=_default_read_ahead, fields=None, **kwargs):
+        """
+        Generator over every episode matching the ``kwargs`` filters,
+        requested ``page_size`` at a time via ``limit``/``offset``.
+        :param page_size: number of episodes per request
+        :param read_ahead: max number of prefetched pages held in memory
+        :return: generator of ``Episode`` objects
+        """
+        pages = self._iter_offset_pages(EpisodeEndpoint.episodes,
+                                        page_size, read_ahead, kwargs)
+        prune = fields and projection(fields)
+        for page in pages:
+            self._cache_items(EpisodeEndpoint.episode, page)
+            for ep in self._wrap(page, Episode, prune=prune):
+                yield ep
 
     @handle_http_exceptions()
     def episode(self, episode_id):
@@ -97,9 +300,31 @@ class MHClient(object):
         return Episode(ep, self)
 
     @handle_http_exceptions()
-    def search_episodes(self, **kwargs):
+    def search_episodes(self, prefetch=None, fields=None, **kwargs):
+        """
+        :param fields: keep only these dotted paths of each episode's data
+        """
         eps = SearchEndpoint.episodes(self, **kwargs)
-        return [SearchEpisode(x, self) for x in eps]
+        self._cache_items(SearchEndpoint.episode, eps)
+        return self._prefetch(self._wrap(eps, SearchEpisode, fields), prefetch)
+
+    def iter_search_episodes(self, page_size=_default_page_size,
+                             read_ahead=_default_read_ahead, fields=None,
+                             **kwargs):
+        """
+        Generator over every search episode matching the ``kwargs`` filters,
+        requested ``page_size`` at a time via ``limit``/``offset``.
+        :param page_size: number of episodes per request
+        :param read_ahead: max number of prefetched pages held in memory
+        :return: generator of ``SearchEpisode`` objects
+        """
+        pages = self._iter_offset_pages(SearchEndpoint.episodes,
+                                        page_size, read_ahead, kwargs)
+        prune = fields and projection(fields)
+        for page in pages:
+            self._cache_items(SearchEndpoint.episode, page)
+            for ep in self._wrap(page, SearchEpisode, prune=prune):
+                yield ep
 
     @handle_http_exceptions()
     def search_episode(self, episode_id):
@@ -107,9 +332,12 @@ class MHClient(object):
         return SearchEpisode(ep, self)
 
     @handle_http_exceptions()
-    def agents(self):
+    def agents(self, fields=None):
+        """
+        :param fields: keep only these dotted paths of each agent's data
+        """
         agents_ = CaptureEndpoint.agents(self)
-        return [CaptureAgent(x, self) for x in agents_]
+        return self._wrap(agents_, CaptureAgent, fields)
 
     @handle_http_exceptions()
     def agent(self, agent_name):
@@ -117,9 +345,9 @@ class MHClient(object):
         return CaptureAgent(agent_, self)
 
     @handle_http_exceptions()
-    def hosts(self):
+    def hosts(self, prefetch=None):
         hosts_ = ServicesEndpoint.hosts(self)
-        return [ServiceHost(x, self) for x in hosts_]
+        return self._prefetch([ServiceHost(x, self) for x in hosts_], prefetch)
 
     @handle_http_exceptions()
     def job(self, job_id):
@@ -131,9 +359,148 @@ class MHClient(object):
         statistics_ = ServicesEndpoint.statistics(self)
         return ServiceStatistics(statistics_, self)
 
+    @handle_http_exceptions()
+    def resolve(self, objects, *paths, **kwargs):
+        """
+        Resolve lazy relations for a whole list of endpoint objects at once.
+        Pending requests are deduplicated and run concurrently, and the
+        results are stashed on each object, so subsequent attribute access
+        doesn't hit the server. For example,
+        ``client.resolve(ops, 'job.children')`` fetches every distinct job,
+        then every distinct job's children.
+        :param objects: list of ``EndpointObj`` instances
+        :param paths: one or more relation names, using dot notation to
+                      traverse nested relations
+        :param max_workers: max number of concurrent requests (default 8)
+        :return: the ``objects`` list
+        """
+        max_workers = kwargs.get('max_workers', _default_max_workers)
+        objects = list(objects)
+        for path in paths:
+            resolve_refs(objects, path, max_workers)
+        return objects
+
+    def _prefetch(self, objects, prefetch):
+        """
+        Eagerly resolve the relations named in ``prefetch`` (a relation path
+        or list of them) for all ``objects``
+        """
+        if not prefetch:
+            return objects
+        if isinstance(prefetch, six.string_types):
+            prefetch = [prefetch]
+        return self.resolve(objects, *prefetch)
+
+    def _cache_items(self, endpoint_method, items):
+        """
+        With ``cache_list_items`` on, cache each item of a list response as
+        the result of the single-item ``endpoint_method`` for its id
+        """
+        if not self.cache_list_items:
+            return
+        for item in items:
+            if 'id' in item:
+                prime(endpoint_method, self, item, item['id'])
+
+    def _wrap(self, items, class_, fields=None, prune=None):
+        """
+        Wrap response records in ``class_``, first pruning them down to
+        ``fields`` (or with the ``prune`` function from ``projection``).
+        Pruned copies are made after any caching, so cached records stay
+        complete.
+        """
+        if fields:
+            prune = projection(fields)
+        if prune:
+            return [class_(prune(x), self) for x in items]
+        return [class_(x, self) for x in items]
+
+    def _wrap_stream(self, items, class_, endpoint_method=None, fields=None):
+        prune = fields and projection(fields)
+        for item in items:
+            if endpoint_method is not None:
+                self._cache_items(endpoint_method, [item])
+            if prune:
+                item = prune(item)
+            yield class_(item, self)
+
+    def _iter_offset_pages(self, endpoint_method, page_size, read_ahead, kwargs):
+        offset = kwargs.pop('offset', None) or 0
+
+        @handle_http_exceptions()
+        def fetch_page(page_num):
+            return endpoint_method(self, **dict(kwargs, limit=page_size,
+                                   offset=offset + page_num * page_size))
+
+        return iter_pages(fetch_page, page_size, read_ahead)
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        with self._sessions_lock:
+            self._sessions[session] = None
+        return session
+
+    @property
+    def session(self):
+        """
+        The ``requests.Session`` used for requests from the current thread.
+        With ``thread_local_sessions`` a thread's session is closed, and its
+        connections released, once the thread has ended.
+        """
+        if not self.thread_local_sessions:
+            return self._shared_session
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            holder = self._local.holder = _SessionHolder(self._new_session())
+            release = _session_releaser(self._sessions, self._sessions_lock,
+                                        holder.session)
+            with self._sessions_lock:
+                if holder.session in self._sessions:
+                    # the weakref has to outlive the holder for its callback
+                    # to be called
+                    self._sessions[holder.session] = weakref.ref(holder, release)
+        return holder.session
+
+    def close(self):
+        """
+        Close all pooled connections held by this client
+        """
+        with self._sessions_lock:
+            sessions = list(self._sessions)
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
     def _http_auth(self):
-        if self.user and self.passwd:
-            return HTTPDigestAuth(self.user, self.passwd)
+        if not (self.user and self.passwd):
+            return None
+        auth = self._auth
+        if auth is None or auth.username != self.user \
+                or auth.password != self.passwd:
+            # built once however many threads make their first request at
+            # the same time; a rebuild keeps the challenge count
+            with self._auth_lock:
+                auth = self._auth
+                if auth is None or auth.username != self.user \
+                        or auth.password != self.passwd:
+                    challenges = auth.challenges if auth is not None else 0
+                    auth = self._auth = _DigestAuth(self.user, self.passwd,
+                                                    challenges)
+        return auth
+
+    @property
+    def auth_challenges(self):
+        """
+        Number of digest auth challenge (401) round-trips made so far
+        """
+        if self._auth is None:
+            return 0
+        return self._auth.challenges
 
     def get(self, path, params=None, extra_headers=None):
         headers = self.default_headers.copy()
@@ -143,16 +510,110 @@ class MHClient(object):
 
         url = urljoin(self.base_url, path)
 
-        resp = _session.get(url,
-                            params=params,
-                            headers=headers,
-                            auth=self._http_auth(),
-                            timeout=self.timeout
-                            )
+        if self.cache_enabled and path.lstrip('/') in _conditional_get_paths:
+            return self._conditional_get(url, params, headers)
+
+        resp = self.session.get(url,
+                                params=params,
+                                headers=headers,
+                                auth=self._http_auth(),
+                                timeout=self.timeout
+                                )
+        resp.raise_for_status()
+        return self._decode(resp)
+
+    def iter_get(self, path, item_path, params=None, extra_headers=None,
+                 chunk_size=_default_chunk_size):
+        """
+        GET a JSON response and parse it incrementally as it's downloaded
+        (see ``utils.iter_json_items``). The request is made, and HTTP errors
+        raised, right away; the items are read as the result is iterated.
+        :param item_path: keys leading to the array of items, e.g.
+                          ``('workflows', 'workflow')``
+        :param chunk_size: number of bytes read from the connection at a time
+        :return: generator of the array's items
+        """
+        headers = self.default_headers.copy()
+
+        if extra_headers is not None:
+            headers.update(extra_headers)
+
+        url = urljoin(self.base_url, path)
+
+        resp = self.session.get(url,
+                                params=params,
+                                headers=headers,
+                                auth=self._http_auth(),
+                                timeout=self.timeout,
+                                stream=True
+                                )
+        try:
+            resp.raise_for_status()
+        except requests.HTTPError:
+            resp.close()
+            raise
+        return self._iter_items(resp, item_path, chunk_size)
+
+    def _iter_items(self, resp, item_path, chunk_size):
+        try:
+            for item in iter_json_items(resp.iter_content(chunk_size),
+                                        item_path, resp.encoding or 'utf-8'):
+                yield item
+        finally:
+            resp.close()
+
+    def _conditional_get(self, url, params, headers):
+        """
+        GET a response that's cached along with its ETag/Last-Modified
+        validators. If the server says it's unchanged (304) the cached data
+        is returned and kept for another ``_conditional_get_ttl`` seconds.
+        """
+        cache_name = 'MHClient.get'
+        cache_key = (url, tuple(sorted((params or {}).items())))
+        cached = self.cache.get(cache_name, cache_key)
+        if cached is not None:
+            etag, last_modified, data = cached
+            headers = headers.copy()
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            if last_modified is not None:
+                headers['If-Modified-Since'] = last_modified
+
+        resp = self.session.get(url,
+                                params=params,
+                                headers=headers,
+                                auth=self._http_auth(),
+                                timeout=self.timeout
+                                )
         resp.raise_for_status()
-        return resp.json()
+        if resp.status_code == 304 and cached is not None:
+            self.cache.extend(cache_name, cache_key, _conditional_get_ttl)
+            return data
+
+        data = self._decode(resp)
+        etag = resp.headers.get('ETag')
+        last_modified = resp.headers.get('Last-Modified')
+        if etag is not None or last_modified is not None:
+            self.cache.set(cache_name, cache_key, (etag, last_modified, data),
+                           _conditional_get_ttl, max_entries=100)
+        return data
+
+    def _decode(self, resp):
+        """
+        Decode a json response straight from its bytes, unless it declares a
+        charset other than UTF-8
+        """
+        encoding = resp.encoding
+        if encoding is None or encoding.lower().replace('-', '') == 'utf8':
+            return self.json_decoder.decode(resp.content)
+        return self.json_decoder.decode(resp.text)
 
-    def post(self, path, data=None, extra_headers=None):
+    def post(self, path, data=None, extra_headers=None, invalidate_tags=None):
+        """
+        :param invalidate_tags: cache tag(s) of the data changed by the post;
+                                matching cached entries are deleted once it
+                                succeeds, e.g. 'host:http://example.edu'
+        """
         headers = self.default_headers.copy()
 
         if extra_headers is not None:
@@ -160,14 +621,16 @@ class MHClient(object):
 
         url = urljoin(self.base_url, path)
 
-        resp = _session.post(url,
-                             data=data,
-                             headers=headers,
-                             auth=self._http_auth(),
-                             timeout=self.timeout
-                             )
+        resp = self.session.post(url,
+                                 data=data,
+                                 headers=headers,
+                                 auth=self._http_auth(),
+                                 timeout=self.timeout
+                                 )
         resp.raise_for_status()
 
+        if invalidate_tags:
+            self.cache.invalidate_tags(invalidate_tags)
         return resp
 
     def clear_cache(self):
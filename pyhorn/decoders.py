@@ -0,0 +1,108 @@
+"""
+pyhorn.decoders
+~~~~~~~~~~~~~~
+strategies for decoding json response bodies
+"""
+
+import six
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+__all__ = ['StdlibDecoder', 'OrjsonDecoder', 'SimdjsonDecoder', 'UjsonDecoder',
+           'get_decoder']
+
+
+class StdlibDecoder(object):
+    """
+    The standard library's ``json`` module. Decodes bytes directly, detecting
+    UTF-8/16/32.
+    """
+
+    name = 'json'
+
+    def decode(self, data):
+        """
+        :param data: a json document, as bytes or text
+        :return: the decoded value; raises ValueError if ``data`` isn't valid
+        """
+        return json.loads(data)
+
+
+class OrjsonDecoder(StdlibDecoder):
+    """
+    orjson (https://github.com/ijl/orjson); UTF-8 only
+    """
+
+    name = 'orjson'
+    module = orjson
+
+    def __init__(self):
+        if self.module is None:
+            raise ValueError("%s decoder requires the %s package"
+                             % (self.name, self.name))
+
+    def decode(self, data):
+        return self.module.loads(data)
+
+
+class SimdjsonDecoder(OrjsonDecoder):
+    """
+    pysimdjson (https://github.com/TkTech/pysimdjson)
+    """
+
+    name = 'simdjson'
+    module = simdjson
+
+
+class UjsonDecoder(OrjsonDecoder):
+    """
+    ujson (https://github.com/ultrajson/ultrajson)
+    """
+
+    name = 'ujson'
+    module = ujson
+
+
+_decoders = {
+    'json': StdlibDecoder,
+    'orjson': OrjsonDecoder,
+    'simdjson': SimdjsonDecoder,
+    'ujson': UjsonDecoder,
+}
+
+# fastest first
+_preferred = (OrjsonDecoder, SimdjsonDecoder, UjsonDecoder)
+
+def get_decoder(decoder):
+    """
+    :param decoder: a decoder instance, a decoder name ('json', 'orjson',
+                    'simdjson' or 'ujson'), or None for the fastest one
+                    installed, falling back to 'json'
+    :return: a decoder instance
+    """
+    if decoder is None:
+        for cls in _preferred:
+            if cls.module is not None:
+                return cls()
+        return StdlibDecoder()
+    if isinstance(decoder, six.string_types):
+        try:
+            cls = _decoders[decoder]
+        except KeyError:
+            raise ValueError("unknown json decoder %r" % decoder)
+        return cls()
+    return decoder
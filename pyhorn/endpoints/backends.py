@@ -0,0 +1,216 @@
+"""
+pyhorn.endpoints.backends
+~~~~~~~~~~~~~~
+persistent second-tier stores for EndpointCache
+"""
+
+import os
+import six
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+
+if six.PY3:
+    import pickle
+else:
+    import cPickle as pickle
+
+__all__ = ['CacheBackend', 'SQLiteCacheBackend', 'BackendEntry']
+
+# written is the time the entry was stored, pid the process that stored it
+BackendEntry = namedtuple('BackendEntry',
+                          'value expires stale_until written pid tags')
+
+
+def backend_key(key):
+    """
+    Stable string form of a cache key, identical across processes. Hash
+    ordering of frozensets isn't, so their items are sorted.
+    """
+    def canonical(value):
+        if isinstance(value, (frozenset, set)):
+            return ('__set__',) + tuple(sorted((canonical(x) for x in value), key=repr))
+        if isinstance(value, (tuple, list)):
+            return tuple(canonical(x) for x in value)
+        return value
+    return repr(canonical(key))
+
+
+def _join_tags(tags):
+    # newline-delimited on both ends, so each tag can be matched with instr()
+    return '\n' + ''.join(tag + '\n' for tag in sorted(tags))
+
+
+class CacheBackend(object):
+    """
+    Interface for a shared store sitting behind the in-memory EndpointCache.
+    Values are passed in and returned as-is; backends serialize them as
+    needed. Times are unix timestamps.
+    """
+
+    def get(self, method, key):
+        """
+        :return: a BackendEntry, or None if the key isn't stored or is past
+                 its stale window
+        """
+        raise NotImplementedError
+
+    def set(self, method, key, value, expires, stale_until, max_entries,
+            tags=()):
+        """
+        Store a value, evicting the oldest entries of ``method`` beyond
+        ``max_entries``
+        """
+        raise NotImplementedError
+
+    def touch(self, method, key, expires, stale_until):
+        """
+        Renew the expiration of a stored entry, e.g. after a conditional GET
+        confirmed it's current. Optional: by default the entry keeps its
+        original expiration.
+        """
+        pass
+
+    def invalidate_tags(self, tags):
+        """
+        Delete all entries carrying any of ``tags``
+        """
+        raise NotImplementedError
+
+    def delete(self, method, key):
+        raise NotImplementedError
+
+    def clear(self, method=None):
+        raise NotImplementedError
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Stores entries in a SQLite database in WAL mode, so that any number of
+    processes on the same machine can share (and warm-start from) one cache
+    file. Each set is a single atomic transaction. When a method exceeds its
+    ``max_entries`` the least recently written entries are evicted.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        """
+        :param path: database file location; created if necessary
+        :param timeout: seconds to wait for a lock held by another process
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    method TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    expires REAL NOT NULL,
+                    stale_until REAL NOT NULL,
+                    written REAL NOT NULL,
+                    pid INTEGER NOT NULL,
+                    tags TEXT NOT NULL,
+                    PRIMARY KEY (method, key)
+                )""")
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS entries_written
+                ON entries (method, written)""")
+
+    def _conn(self):
+        # sqlite connections can't be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, method, key):
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires, stale_until, written, pid, tags FROM entries "
+                "WHERE method = ? AND key = ? AND stale_until > ?",
+                (method, backend_key(key), time.time())).fetchone()
+        except sqlite3.OperationalError:
+            # e.g. locked for longer than the timeout; treat as a miss
+            return None
+        if row is None:
+            return None
+        try:
+            value = pickle.loads(bytes(row[0]))
+        except pickle.PickleError:
+            return None
+        tags = frozenset(row[5].split('\n')[1:-1])
+        return BackendEntry(value, row[1], row[2], row[3], row[4], tags)
+
+    def set(self, method, key, value, expires, stale_until, max_entries,
+            tags=()):
+        blob = sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        conn = self._conn()
+        try:
+            self._set(conn, method, key, blob, expires, stale_until,
+                      max_entries, _join_tags(tags))
+        except sqlite3.OperationalError:
+            # the entry is still cached in memory
+            pass
+
+    def _set(self, conn, method, key, blob, expires, stale_until, max_entries,
+             tags):
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(method, key, value, expires, stale_until, written, pid, tags) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (method, backend_key(key), blob, expires, stale_until,
+                 time.time(), os.getpid(), tags))
+            conn.execute(
+                "DELETE FROM entries WHERE method = ? AND stale_until <= ?",
+                (method, time.time()))
+            conn.execute(
+                "DELETE FROM entries WHERE method = ? AND key IN ("
+                "SELECT key FROM entries WHERE method = ? "
+                "ORDER BY written DESC, rowid DESC LIMIT -1 OFFSET ?)",
+                (method, method, max_entries))
+
+    def touch(self, method, key, expires, stale_until):
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE entries SET expires = ?, stale_until = ? "
+                    "WHERE method = ? AND key = ?",
+                    (expires, stale_until, method, backend_key(key)))
+        except sqlite3.OperationalError:
+            # the entry is still renewed in memory
+            pass
+
+    def delete(self, method, key):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM entries WHERE method = ? AND key = ?",
+                         (method, backend_key(key)))
+
+    def invalidate_tags(self, tags):
+        conn = self._conn()
+        with conn:
+            for tag in tags:
+                conn.execute("DELETE FROM entries WHERE instr(tags, ?) > 0",
+                             (_join_tags([tag]),))
+
+    def clear(self, method=None):
+        conn = self._conn()
+        with conn:
+            if method is None:
+                conn.execute("DELETE FROM entries")
+            else:
+                conn.execute("DELETE FROM entries WHERE method = ?", (method,))
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
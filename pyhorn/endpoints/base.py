@@ -4,6 +4,18 @@ pyhorn.endpoints.base
 base classes for endpoint and object wrapper classes
 """
 
+import six
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # python 2
+    from collections import Mapping
+
+_ref_collector = threading.local()
+
 class Endpoint(object):
 
     @classmethod
@@ -34,12 +46,45 @@ class Endpoint(object):
 
 
 class EndpointObj(object):
+    """
+    Wraps a dict of response data, exposing its keys as attributes, with
+    dashes in key names read as underscores (e.g. ``obj.agent_url`` for
+    "agent-url"). The dict is kept as is rather than copied; key names are
+    translated on access.
+    """
+    __slots__ = ('_data', '_keys', '_stash', 'client')
 
     def __init__(self, raw_data, client):
-        self._raw = dict((k.replace('-','_'), v) for k,v in raw_data.items())
-        self._property_stash = {}
+        self._data = raw_data
+        # normalized -> original name of the dashed keys, built on first use
+        self._keys = None
+        self._stash = None
         self.client = client
 
+    @property
+    def _raw(self):
+        """
+        Read-only view of the response data with normalized key names
+        """
+        return _RawView(self)
+
+    @property
+    def _property_stash(self):
+        if self._stash is None:
+            self._stash = {}
+        return self._stash
+
+    def _lookup(self, key):
+        # the original key name for an attribute name, or None
+        if key in self._data:
+            return key
+        if '_' not in key:
+            return None
+        if self._keys is None:
+            self._keys = dict((k.replace('-', '_'), k)
+                              for k in self._data if '-' in k)
+        return self._keys.get(key)
+
     @property
     def url(self):
         raise NotImplementedError
@@ -62,34 +107,195 @@ class EndpointObj(object):
 
     def _ref_property(self, name, endpoint_method=None, endpoint_params=None,
                           path_key=None, class_=None, single=False):
-        if name in self._property_stash:
-            return self._property_stash[name]
+        if self._stash is not None and name in self._stash:
+            return self._stash[name]
 
         if endpoint_method is not None:
+            pending = getattr(_ref_collector, 'pending', None)
+            if pending is not None:
+                # batch resolution in progress; defer the request
+                pending.append(_PendingRef(self, name, endpoint_method,
+                                           endpoint_params, class_, single))
+                return None
             items = endpoint_method(self.client, **endpoint_params)
         elif path_key is not None:
             items = self.raw_get(path_key)
 
-        if items is None:
-            items = []
-        elif isinstance(items, dict):
-            items = [items]
-
-        if class_ is not None:
-            items = [class_(x, self.client) for x in items]
-
-        if single:
-            items = len(items) > 0 and items[0] or None
-
+        items = _wrap_ref_items(items, self.client, class_, single)
         self._property_stash[name] = items
 
         return items
 
     def __getattr__(self, attribute):
 
-        if attribute in self._raw:
-            return self._raw[attribute]
+        if attribute in _slot_names:
+            # not set yet, e.g. while unpickling
+            raise AttributeError(attribute)
+
+        data = self._data
+        if attribute in data:
+            return data[attribute]
+        key = self._lookup(attribute)
+        if key is not None:
+            return data[key]
 
         raise AttributeError("response data for %r has no key %r" %
                               (self.__class__, attribute))
 
+
+_slot_names = frozenset(EndpointObj.__slots__)
+
+
+class _RawView(Mapping):
+    """
+    An EndpointObj's response data, as a mapping with normalized key names
+    """
+    __slots__ = ('_obj',)
+
+    def __init__(self, obj):
+        self._obj = obj
+
+    def __getitem__(self, key):
+        original = self._obj._lookup(key)
+        if original is None:
+            raise KeyError(key)
+        return self._obj._data[original]
+
+    def __contains__(self, key):
+        return self._obj._lookup(key) is not None
+
+    def __iter__(self):
+        for key in self._obj._data:
+            yield key.replace('-', '_')
+
+    def __len__(self):
+        return len(self._obj._data)
+
+
+def projection(fields):
+    """
+    A function that prunes a response record down to ``fields``, building
+    new dicts (cached records are left alone). Paths are those understood by
+    ``EndpointObj.raw_get``, and descend into lists along the way, e.g.
+    ``['id', 'mediapackage.id', 'operations.operation.started']``.
+    :param fields: dotted path, or list of them, to keep
+    :return: function of a record returning the pruned record
+    """
+    if isinstance(fields, six.string_types):
+        fields = [fields]
+    # nested dict of the paths' keys; None keeps the whole value
+    tree = {}
+    for path in sorted(fields, key=lambda x: x.count('.')):
+        node = tree
+        keys = path.split('.')
+        for key in keys[:-1]:
+            node = node.setdefault(key, {})
+            if node is None:
+                break
+        else:
+            node[keys[-1]] = None
+
+    def _prune(value, node):
+        if node is None:
+            return value
+        if isinstance(value, list):
+            return [_prune(x, node) for x in value]
+        if isinstance(value, dict):
+            return dict((k, _prune(value[k], sub))
+                        for k, sub in node.items() if k in value)
+        return value
+
+    def _project(record):
+        # top-level names are matched as EndpointObj normalizes them
+        pruned = {}
+        for k, v in record.items():
+            name = k.replace('-', '_')
+            if name in tree:
+                pruned[k] = _prune(v, tree[name])
+        return pruned
+    return _project
+
+
+def _wrap_ref_items(items, client, class_=None, single=False):
+    if items is None:
+        items = []
+    elif isinstance(items, dict):
+        items = [items]
+
+    if class_ is not None:
+        items = [class_(x, client) for x in items]
+
+    if single:
+        items = len(items) > 0 and items[0] or None
+
+    return items
+
+
+class _PendingRef(object):
+
+    def __init__(self, obj, name, endpoint_method, endpoint_params,
+                 class_, single):
+        self.obj = obj
+        self.name = name
+        self.endpoint_method = endpoint_method
+        self.endpoint_params = endpoint_params
+        self.class_ = class_
+        self.single = single
+
+    @property
+    def key(self):
+        return (self.endpoint_method,
+                tuple(sorted(self.endpoint_params.items())))
+
+
+def _collect_refs(objects, name):
+    """
+    Access the ``name`` relation on each object, deferring any requests it
+    would make.
+    :return: list of ``_PendingRef`` for the relations that need a request
+    """
+    _ref_collector.pending = []
+    try:
+        for obj in objects:
+            getattr(obj, name)
+        return _ref_collector.pending
+    finally:
+        _ref_collector.pending = None
+
+
+def resolve_refs(objects, path, max_workers):
+    """
+    Resolve the (dotted) relation ``path`` for every object in ``objects``.
+    At each level of the path the pending requests of all objects are
+    collected, deduplicated and run concurrently, and the results are
+    stashed on the objects as though each relation had been accessed.
+    :param objects: list of ``EndpointObj``
+    :param path: relation name(s) using dot notation, e.g. "job.children"
+    :param max_workers: max number of concurrent requests
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for name in path.split('.'):
+            pending = _collect_refs(objects, name)
+
+            futures = {}
+            for ref in pending:
+                if ref.key not in futures:
+                    futures[ref.key] = executor.submit(
+                        ref.endpoint_method, ref.obj.client, **ref.endpoint_params)
+
+            wrapped = {}
+            for ref in pending:
+                if ref.key not in wrapped:
+                    wrapped[ref.key] = _wrap_ref_items(futures[ref.key].result(),
+                                                       ref.obj.client,
+                                                       ref.class_, ref.single)
+                ref.obj._property_stash[ref.name] = wrapped[ref.key]
+
+            next_objects = []
+            for obj in objects:
+                value = getattr(obj, name)
+                if isinstance(value, list):
+                    next_objects.extend(value)
+                elif value is not None:
+                    next_objects.append(value)
+            objects = next_objects
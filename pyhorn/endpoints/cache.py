@@ -1,106 +1,923 @@
+import os
 import six
+import math
+import inspect
 import time
-from rwlock import RWLock
+import heapq
+import random
+import weakref
+import itertools
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-from collections import defaultdict
-
-if six.PY3:
-    import pickle
-else:
-    import cPickle as pickle
+from collections import defaultdict, OrderedDict, deque
+from .storage import get_storage, LOAD_ERRORS
 
 DEFAULT_TTL = 300
 DEFAULT_MAX_ENTRIES = 3000
+DEFAULT_STALE_TTL = 0
+DEFAULT_EARLY_REFRESH = 1.0
+REFRESH_WORKERS = 2
+SWEEP_INTERVAL = 60
+SWEEP_BATCH = 10
+# the expiry heap is rebuilt from the live entries once it holds more than
+# twice as many items as there are entries, and at least this many
+HEAP_COMPACT_MIN = 1000
+STATS_SAMPLES = 1000
+TERMINAL_TTL = 6 * 3600
+
+def cached(ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+           stale_ttl=DEFAULT_STALE_TTL, early_refresh=DEFAULT_EARLY_REFRESH,
+           negative_ttl=None, listing=False, kwarg_map=None, tags=None):
+    """
+    :param ttl: seconds a cached response is considered fresh, or a function
+                of the response returning that, e.g. ``state_ttl(...)``
+    :param max_entries: max number of entries cached for the method
+    :param stale_ttl: seconds past expiration that a stale response is still
+                      returned immediately while it's refreshed in the
+                      background; cached "not found" results don't get one
+    :param early_refresh: weight of the probabilistic early refresh of
+                          entries about to expire; 0 disables it. Entries
+                          that took longer to fetch are refreshed earlier.
+    :param negative_ttl: if set, "not found" results, i.e. None or a 404
+                         response, are also cached, for this many seconds
+    :param listing: the method returns a listing; only cached if the client's
+                    ``cache_listings`` is on
+    :param kwarg_map: name of the class's ``_kwarg_map`` entry that the
+                      method's ``**kwargs`` are mapped with; defaults to the
+                      method's name
+    :param tags: function, or list of functions, of the response returning
+                 tags for the entry, e.g. ``tag_by(...)``; see
+                 ``EndpointCache.invalidate_tags``
+    """
+    def entry_ttl(value):
+        if negative_ttl is not None and isinstance(value, NegativeResult):
+            return negative_ttl
+        return ttl(value) if callable(ttl) else ttl
+
+    def entry_stale_ttl(value):
+        if isinstance(value, NegativeResult):
+            return 0
+        return stale_ttl
+
+    tag_funcs = tags if isinstance(tags, (list, tuple)) else [tags] if tags else []
+
+    def entry_tags(value):
+        if isinstance(value, NegativeResult):
+            return ()
+        return set(tag for func in tag_funcs for tag in func(value))
 
-def cached(ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
     def wrap(func):
+        make_key = _key_generator(func, kwarg_map or func.__name__)
+
         @wraps(func)
         def wrapped(cls, client, *args, **kwargs):
 
-            if not client.cache_enabled:
+            if not client.cache_enabled \
+                    or (listing and not client.cache_listings):
                 return func(cls, client, *args, **kwargs)
 
-            cache_key = _generate_cache_key(args, kwargs)
+            cache_key = make_key(cls, client, args, kwargs)
             cache_name = cls.__name__ + '.' + func.__name__
-            res = client.cache.get(cache_name, cache_key)
+            compute = lambda: func(cls, client, *args, **kwargs)
+            if negative_ttl is not None:
+                compute = _negative_compute(compute)
+            res, needs_refresh = client.cache.lookup(cache_name, cache_key,
+                                                     early_refresh)
 
             if res is None:
-                res = func(cls, client, *args, **kwargs)
-                client.cache.set(cache_name, cache_key, res, ttl, max_entries)
+                res = client.cache.fetch(cache_name, cache_key, compute,
+                                         entry_ttl, max_entries,
+                                         entry_stale_ttl, tags=entry_tags)
+            elif needs_refresh:
+                client.cache.refresh(cache_name, cache_key, compute,
+                                     entry_ttl, max_entries, entry_stale_ttl,
+                                     tags=entry_tags)
 
+            if isinstance(res, NegativeResult):
+                return res.result()
             return res
 
+        wrapped.cache_policy = (entry_ttl, max_entries, entry_stale_ttl,
+                                entry_tags)
+        wrapped.cache_key = make_key
         return wrapped
     return wrap
 
-def _generate_cache_key(args, kwargs):
-    return (args, frozenset(kwargs.items()))
+def prime(endpoint_method, client, value, *args, **kwargs):
+    """
+    Cache ``value`` as the result of ``endpoint_method(client, *args,
+    **kwargs)``, e.g. to store the items of a list response as single-item
+    entries
+    :param endpoint_method: a ``cached`` endpoint classmethod, e.g.
+                            ``WorkflowEndpoint.instance``
+    """
+    if not client.cache_enabled:
+        return
+    func = endpoint_method.__func__
+    ttl, max_entries, stale_ttl, tags = func.cache_policy
+    cache_name = endpoint_method.__self__.__name__ + '.' + func.__name__
+    value_ttl = ttl(value)
+    if value_ttl > 0:
+        cache_key = func.cache_key(endpoint_method.__self__, client, args, kwargs)
+        client.cache.set(cache_name, cache_key, value, value_ttl, max_entries,
+                         stale_ttl(value), tags=tags(value))
 
+def state_ttl(field, terminal_states, terminal_ttl, ttl):
+    """
+    A ``ttl`` policy for objects that stop changing once they reach a final
+    state, e.g. finished workflows and jobs
+    :param field: name of the response's state field
+    :param terminal_states: states in which the object no longer changes
+    :param terminal_ttl: ttl for responses in one of ``terminal_states``; for
+                         list responses every item has to be, and the list
+                         can't be empty
+    :param ttl: ttl for all other responses
+    """
+    terminal_states = frozenset(terminal_states)
 
-class EndpointCache(object):
+    def _ttl(value):
+        items = value if isinstance(value, list) else [value]
+        if items and all(isinstance(x, dict) and x.get(field) in terminal_states
+                         for x in items):
+            return terminal_ttl
+        return ttl
+    return _ttl
+
+def tag_by(prefix, path):
+    """
+    A ``tags`` policy that tags an entry ``<prefix>:<value>`` for each value
+    found at the dotted ``path`` of the response, descending into lists
+    along the way, e.g. ``tag_by('host', 'statistics.service.host')``
+    """
+    keys = path.split('.')
+
+    def _values(data, keys):
+        if isinstance(data, list):
+            for item in data:
+                for value in _values(item, keys):
+                    yield value
+        elif not keys:
+            if data is not None:
+                yield data
+        elif isinstance(data, dict):
+            for value in _values(data.get(keys[0]), keys[1:]):
+                yield value
+
+    def _tags(value):
+        return ['%s:%s' % (prefix, x) for x in _values(value, keys)]
+    return _tags
+
+def _key_generator(func, kwarg_map):
+    """
+    :return: a function of (cls, client, args, kwargs) returning the cache
+             key for that call of ``func``
+    """
+    if six.PY3:
+        spec = inspect.getfullargspec(func)
+        varkw = spec.varkw
+    else:
+        spec = inspect.getargspec(func)
+        varkw = spec.keywords
+    # the cls and client params
+    skip = spec.args[:2]
+
+    def make_key(cls, client, args, kwargs):
+        map_name = None
+        if varkw is not None and kwarg_map in getattr(cls, '_kwarg_map', {}):
+            map_name = kwarg_map
+        return _generate_cache_key(func, cls, client, args, kwargs,
+                                   skip, varkw, map_name)
+    return make_key
+
+def _generate_cache_key(func, cls, client, args, kwargs, skip=(), varkw=None,
+                        kwarg_map=None):
+    """
+    A key that's the same however equivalent arguments are passed: they're
+    bound to the function's parameter names, ``**kwargs`` are mapped to the
+    query params they produce via the class's ``_kwarg_map`` entry (filling
+    in defaults), and containers are made hashable and order-independent
+    :param skip: names of parameters to leave out, i.e. cls and client
+    :param varkw: name of the function's ``**kwargs`` parameter
+    :param kwarg_map: name of the ``_kwarg_map`` entry for the ``**kwargs``
+    """
+    callargs = inspect.getcallargs(func, cls, client, *args, **kwargs)
+    for name in skip:
+        del callargs[name]
+    if varkw is not None:
+        extra = callargs.pop(varkw)
+        if kwarg_map is not None:
+            extra = cls.map_kwargs_to_params(kwarg_map, extra)
+        callargs.update(extra)
+    return tuple(sorted((k, _canonical(v)) for k, v in callargs.items()))
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return tuple(sorted(((k, _canonical(v)) for k, v in value.items()),
+                            key=repr))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((_canonical(v) for v in value), key=repr))
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonical(v) for v in value)
+    return value
+
+
+class NegativeResult(object):
+    """
+    Cached in place of a "not found" result, which would otherwise be
+    indistinguishable from a miss: a None return value, or (if ``url`` is set)
+    a 404 response for that url
+    """
+
+    def __init__(self, url=None):
+        self.url = url
+
+    def result(self):
+        """
+        :return: None, or raise the same HTTPError as the original response
+        """
+        if self.url is None:
+            return None
+        resp = requests.Response()
+        resp.status_code = 404
+        resp.reason = 'Not Found'
+        resp.url = self.url
+        resp.request = requests.Request('GET', self.url).prepare()
+        raise requests.HTTPError("404 Client Error: Not Found for url: %s"
+                                 % self.url, response=resp)
+
+
+def _negative_compute(compute):
+    def _compute():
+        try:
+            value = compute()
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            return NegativeResult(e.response.url)
+        if value is None:
+            return NegativeResult()
+        return value
+    return _compute
+
+
+class _Flight(object):
+    """
+    An in-progress fetch that concurrent callers can wait on
+    """
 
     def __init__(self):
-        self._locks = defaultdict(RWLock)
-        self._caches = defaultdict(dict)
-        self._expire_info = defaultdict(dict)
+        self._done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _move_to_end(od, key):
+    try:
+        od.move_to_end(key)
+    except AttributeError:
+        # python 2
+        od[key] = od.pop(key)
+
+
+class _Entry(object):
+    """
+    A cached value and its metadata. Everything but the access bookkeeping
+    is fixed once the entry is stored, so readers can use an entry without
+    locking; changes replace it with a new one.
+    """
+    __slots__ = ('stored', 'expires', 'stale_until', 'delta', 'size', 'tags',
+                 'accessed', 'referenced')
+
+    def __init__(self, stored, expires, stale_until, delta, size, tags,
+                 accessed):
+        self.stored = stored
+        self.expires = expires
+        self.stale_until = stale_until
+        self.delta = delta
+        self.size = size
+        self.tags = tags
+        # tick of the last access, and whether it was accessed since the
+        # eviction "clock hand" last passed it
+        self.accessed = accessed
+        self.referenced = False
+
+    def renewed(self, expires, stale_until, accessed):
+        entry = _Entry(self.stored, expires, stale_until, self.delta,
+                       self.size, self.tags, accessed)
+        entry.referenced = True
+        return entry
+
+
+class EndpointCache(object):
+    """
+    In-memory store of endpoint responses. Entries are kept per method in
+    insertion order and evicted "CLOCK" style, an approximation of LRU: when
+    a method reaches its ``max_entries``, or the payloads of all methods
+    exceed ``max_bytes``, the oldest entries are evicted first, except that
+    entries read since the last pass get a second chance.
+
+    Reads don't take any lock: entries are immutable records swapped in and
+    out of each method's dict by writers, which are serialized per method.
+    ``clear`` swaps in an empty dict, so it's atomic with respect to
+    concurrent reads and writes.
+
+    Entries whose expiration (plus stale window) has passed are reclaimed
+    in expiration order, a few at a time on each ``set`` and in bulk by a
+    background sweeper thread every ``sweep_interval`` seconds, whether or
+    not they are ever looked up again. The expiration heap is compacted once
+    most of it belongs to entries that are gone or were renewed.
+
+    An optional ``backend`` (see ``.backends``) adds a shared, persistent
+    second tier: every entry set is also written there, and misses in memory
+    are looked up there before being fetched.
+    """
+
+    def __init__(self, max_bytes=None, sweep_interval=SWEEP_INTERVAL,
+                 storage=None, backend=None):
+        """
+        :param max_bytes: optional limit on the total size of the stored
+                          payloads across all methods
+        :param sweep_interval: seconds between background sweeps of expired
+                               entries; None disables the sweeper thread
+        :param storage: how values are stored; 'pickle' (default), 'frozen',
+                        'compressed' or an instance from ``.storage``
+        :param backend: optional CacheBackend instance, e.g.
+                        SQLiteCacheBackend, shared between processes
+        """
+        self.storage = get_storage(storage)
+        self.backend = backend
+        self._created = time.time()
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._expiry_heap = []
+        self._heap_lock = threading.Lock()
+        self._sweeper = None
+        self._locks = {}
+        # method name -> key -> _Entry
+        self._caches = defaultdict(OrderedDict)
+        self._tag_index = defaultdict(set)
+        self._tags_lock = threading.Lock()
+        self._ticks = itertools.count()
+        self._bytes = 0
+        self._bytes_lock = threading.Lock()
+        self._budget_lock = threading.Lock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._refresher = None
+        self._refresher_lock = threading.Lock()
+        self._max_entries = defaultdict(lambda: DEFAULT_MAX_ENTRIES)
+        self._stats_lock = threading.Lock()
+        # hits include stale_hits, entries returned while being refreshed,
+        # and negative_hits, cached "not found" results
+        self.hits = defaultdict(int)
+        self.stale_hits = defaultdict(int)
+        self.negative_hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.expirations = defaultdict(int)
+        self.evictions = defaultdict(int)
+        self.revalidations = defaultdict(int)
+        self.invalidations = defaultdict(int)
+        self.coalesced = defaultdict(int)
+        # hits served from the backend; of those, entries written before this
+        # cache was created, and entries written by other processes
+        self.backend_hits = defaultdict(int)
+        self.warm_start_hits = defaultdict(int)
+        self.cross_process_hits = defaultdict(int)
+        # recent storage dump/load durations, in seconds
+        self._dump_times = defaultdict(lambda: deque(maxlen=STATS_SAMPLES))
+        self._load_times = defaultdict(lambda: deque(maxlen=STATS_SAMPLES))
+
+    def _lock(self, method):
+        # serializes the writers of a method
+        lock = self._locks.get(method)
+        if lock is None:
+            lock = self._locks.setdefault(method, threading.Lock())
+        return lock
+
+    def fetch(self, method, key, compute, ttl=DEFAULT_TTL,
+              max_entries=DEFAULT_MAX_ENTRIES, stale_ttl=DEFAULT_STALE_TTL,
+              force=False, tags=None):
+        """
+        Call ``compute`` and cache the result, making sure only one call is in
+        progress per method/key. Concurrent callers for the same key wait for
+        the first one and get its result (or its exception).
+        :param compute: callable that fetches the value to be cached
+        :param ttl: seconds to cache the value, or a function of the value
+                    returning that; the value isn't stored if it's <= 0, or
+                    if the value is None
+        :param stale_ttl: seconds the value is served stale past its ttl, or
+                          a function of the value returning that
+        :param force: call ``compute`` even if a fresh value is cached
+        :param tags: function of the value returning the entry's tags
+        :return: the computed value
+        """
+        flight_key = (method, key)
+        with self._flights_lock:
+            flight = self._flights.get(flight_key)
+            if flight is not None:
+                self._count('coalesced', method)
+                leader = False
+            else:
+                flight = self._flights[flight_key] = _Flight()
+                leader = True
+
+        if not leader:
+            return flight.wait()
+
+        value = error = None
+        try:
+            # a previous flight may have finished since our caller's miss
+            value = None if force else self._get(method, key)
+            if value is None:
+                started = time.time()
+                value = compute()
+                delta = time.time() - started
+                value_ttl = ttl(value) if callable(ttl) else ttl
+                # a stored None would read as a miss; "not found" results are
+                # only cached wrapped in a NegativeResult
+                if value is not None and value_ttl > 0:
+                    if callable(stale_ttl):
+                        stale_ttl = stale_ttl(value)
+                    self.set(method, key, value, value_ttl, max_entries,
+                             stale_ttl, delta=delta,
+                             tags=tags(value) if tags else ())
+        except BaseException as e:
+            # including KeyboardInterrupt/SystemExit; the waiters must never
+            # be left hanging
+            error = e
+            raise
+        finally:
+            self._land(flight_key)
+            flight.finish(value, error)
+        return value
+
+    def _land(self, flight_key):
+        with self._flights_lock:
+            del self._flights[flight_key]
+
+    def refresh(self, method, key, compute, ttl=DEFAULT_TTL,
+                max_entries=DEFAULT_MAX_ENTRIES, stale_ttl=DEFAULT_STALE_TTL,
+                tags=None):
+        """
+        Re-fetch an entry on a background thread, unless a fetch for it is
+        already in progress. Errors are discarded, leaving the current entry
+        in place until it expires.
+        """
+        if (method, key) in self._flights:
+            return
+        with self._refresher_lock:
+            if self._refresher is None:
+                self._refresher = ThreadPoolExecutor(max_workers=REFRESH_WORKERS)
+        self._refresher.submit(self.fetch, method, key, compute, ttl,
+                               max_entries, stale_ttl, True, tags)
+
+    def lookup(self, method, key, early_refresh=0):
+        """
+        Get an entry along with whether it should be refreshed, i.e. it's
+        within its stale window, or it's about to expire and was picked for
+        probabilistic early refresh.
+        :param early_refresh: weight of the early refresh; 0 disables it
+        :return: (value, needs_refresh) tuple; value is None on a miss
+        """
+        entry = self._read(method, key)
+        if entry is None:
+            self._count('misses', method)
+            return None, False
+
+        self._count('hits', method)
+        value, expires, delta = entry
+        if isinstance(value, NegativeResult):
+            self._count('negative_hits', method)
+        now = time.time()
+        if now >= expires:
+            self._count('stale_hits', method)
+            return value, True
+        if early_refresh and delta:
+            # "XFetch": refresh with increasing probability as expiration
+            # approaches, sooner for entries that are slow to fetch
+            gap = -delta * early_refresh * math.log(1.0 - random.random())
+            return value, now + gap >= expires
+        return value, False
 
     def get(self, method, key, default=None):
 
-        pickled = None
-        with self._locks[method].reader_lock:
-            if not self._has_expired(method, key):
-                pickled = self._caches[method][key]
-        if pickled is not None:
-            try:
-                return pickle.loads(pickled)
-            except pickle.PickleError:
-                return default
-
-        with self._locks[method].writer_lock:
-            try:
-                del self._caches[method][key]
-                del self._expire_info[method][key]
-            except KeyError:
-                pass
+        value = self._get(method, key)
+        if value is None:
+            self._count('misses', method)
             return default
+        self._count('hits', method)
+        return value
+
+    def _get(self, method, key):
+        # fresh entries only
+        entry = self._read(method, key)
+        if entry is None:
+            return None
+        value, expires, delta = entry
+        if expires <= time.time():
+            return None
+        return value
+
+    def _read(self, method, key):
+        """
+        Load an entry that is fresh or within its stale window, from memory
+        or else from the backend
+        :return: (value, expires, delta) tuple, or None
+        """
+        cache = self._caches.get(method)
+        entry = cache.get(key) if cache is not None else None
+
+        if entry is not None and entry.stale_until <= time.time():
+            self._expire(method, key, entry)
+            entry = None
+
+        if entry is None:
+            return self._read_backend(method, key)
+
+        entry.accessed = next(self._ticks)
+        entry.referenced = True
+        started = time.time()
+        try:
+            value = self.storage.load(entry.stored)
+        except LOAD_ERRORS:
+            return None
+        self._load_times[method].append(time.time() - started)
+        return value, entry.expires, entry.delta
+
+    def _read_backend(self, method, key):
+        if self.backend is None:
+            return None
+        entry = self.backend.get(method, key)
+        if entry is None:
+            return None
+
+        self._count('backend_hits', method)
+        if entry.written < self._created:
+            self._count('warm_start_hits', method)
+        if entry.pid != os.getpid():
+            self._count('cross_process_hits', method)
+
+        self._store(method, key, entry.value, entry.expires,
+                    entry.stale_until, self._max_entries[method],
+                    tags=entry.tags)
+        return entry.value, entry.expires, 0
+
+    def _expire(self, method, key, entry):
+        # expired entries are kept around for the length of their stale
+        # window; only delete the one the caller saw, not a newer one
+        with self._lock(method):
+            if self._caches[method].get(key) is entry:
+                self._delete(method, key)
+                self._count('expirations', method)
 
     def set(self, method, key, value, ttl=DEFAULT_TTL,
-            max_entries=DEFAULT_MAX_ENTRIES):
-        with self._locks[method].writer_lock:
-            if len(self._caches[method]) >= max_entries:
-                self._cull(method)
-            self._caches[method][key] = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
-            self._expire_info[method][key] = time.time() + ttl
-
-    def _has_expired(self, method, key):
-        exp = self._expire_info[method].get(key, -1)
-        if exp is None or exp > time.time():
-            return False
+            max_entries=DEFAULT_MAX_ENTRIES, stale_ttl=DEFAULT_STALE_TTL,
+            delta=0, tags=()):
+        """
+        :param tags: strings the entry can be invalidated by, e.g.
+                     'host:http://example.edu'
+        """
+        expires = time.time() + ttl
+        self._max_entries[method] = max_entries
+        self._store(method, key, value, expires, expires + stale_ttl,
+                    max_entries, delta, tags)
+        if self.backend is not None:
+            self.backend.set(method, key, value, expires, expires + stale_ttl,
+                             max_entries, tags)
+
+    def _store(self, method, key, value, expires, stale_until, max_entries,
+               delta=0, tags=()):
+        # put an entry in memory only
+        started = time.time()
+        stored, size = self.storage.dump(value)
+        self._dump_times[method].append(time.time() - started)
+        entry = _Entry(stored, expires, stale_until, delta, size,
+                       frozenset(tags), next(self._ticks))
+        with self._lock(method):
+            cache = self._caches[method]
+            if key in cache:
+                self._delete(method, key)
+            elif len(cache) >= max_entries:
+                self._cull(method, len(cache) - max_entries + 1)
+            cache[key] = entry
+            self._add_bytes(size)
+            if entry.tags:
+                with self._tags_lock:
+                    for tag in entry.tags:
+                        self._tag_index[tag].add((method, key))
+
+        self._push_expiry(stale_until, method, key)
+
+        # amortized reclamation of entries nobody has asked for since expiring
+        self.sweep(SWEEP_BATCH)
+
+        if self.max_bytes is not None and self._bytes > self.max_bytes:
+            self._enforce_budget()
+
+    def extend(self, method, key, ttl=DEFAULT_TTL, stale_ttl=DEFAULT_STALE_TTL):
+        """
+        Renew the expiration of an entry, e.g. once the server has confirmed
+        it's still current, without storing the value again. The renewal is
+        written through to the backend, if any.
+        :return: False if there's no such entry in memory
+        """
+        expires = time.time() + ttl
+        with self._lock(method):
+            cache = self._caches[method]
+            entry = cache.get(key)
+            if entry is None:
+                return False
+            cache[key] = entry.renewed(expires, expires + stale_ttl,
+                                       next(self._ticks))
+
+        self._push_expiry(expires + stale_ttl, method, key)
+        if self.backend is not None:
+            self.backend.touch(method, key, expires, expires + stale_ttl)
+        self._count('revalidations', method)
         return True
 
-    def _cull(self, method):
-        # make room by deleting 1/3 of the existing entries
-        doomed = [k for (i, k) in enumerate(self._caches[method]) if i % 3 == 0]
-        for k in doomed:
-            self._delete(method, k)
+    def _push_expiry(self, stale_until, method, key):
+        """
+        Schedule an entry's reclamation. Items of entries that have been
+        evicted, deleted or renewed since stay in the heap until they come
+        due, so it's compacted when those make up most of it.
+        """
+        with self._heap_lock:
+            heapq.heappush(self._expiry_heap,
+                           (stale_until, next(self._ticks), method, key))
+            if len(self._expiry_heap) > HEAP_COMPACT_MIN \
+                    and len(self._expiry_heap) > 2 * self._entry_count():
+                self._compact_heap()
+            if self._sweeper is None and self.sweep_interval is not None:
+                self._sweeper = _start_sweeper(self)
+
+    def _compact_heap(self, methods=None):
+        # caller holds the heap lock; drops the items of entries that are
+        # gone or have been stored again since, of all methods or ``methods``
+        self._expiry_heap = [
+            item for item in self._expiry_heap
+            if (methods is not None and item[2] not in methods)
+            or _is_current(self, item)]
+        heapq.heapify(self._expiry_heap)
+
+    def _entry_count(self):
+        return sum(len(cache) for cache in list(self._caches.values()))
+
+    def invalidate_tags(self, tags):
+        """
+        Delete every entry carrying any of ``tags``, e.g. after a change on
+        the server, from memory and the backend
+        :param tags: a tag or list of tags
+        :return: number of entries deleted from memory
+        """
+        if isinstance(tags, six.string_types):
+            tags = [tags]
+        with self._tags_lock:
+            doomed = set()
+            for tag in tags:
+                doomed.update(self._tag_index.get(tag, ()))
+
+        deleted = 0
+        for method, key in doomed:
+            with self._lock(method):
+                if self._delete(method, key):
+                    deleted += 1
+                    self._count('invalidations', method)
+
+        if self.backend is not None:
+            self.backend.invalidate_tags(tags)
+        return deleted
+
+    def sweep(self, limit=None):
+        """
+        Delete entries that are past their expiration and stale window
+        :param limit: max number of expired entries to process
+        :return: number of entries deleted
+        """
+        now = time.time()
+        due = []
+        with self._heap_lock:
+            heap = self._expiry_heap
+            while heap and heap[0][0] <= now \
+                    and (limit is None or len(due) < limit):
+                due.append(heapq.heappop(heap))
+
+        deleted = 0
+        for until, tick, method, key in due:
+            with self._lock(method):
+                # skip keys that were deleted or set again since
+                entry = self._caches[method].get(key)
+                if entry is not None and entry.stale_until == until:
+                    self._delete(method, key)
+                    deleted += 1
+                    self._count('expirations', method)
+        return deleted
+
+    def _cull(self, method, count=1):
+        # make room by evicting the least recently used entries
+        cache = self._caches[method]
+        evicted = 0
+        while evicted < count and cache:
+            self._delete(method, _clock_victim(cache))
+            evicted += 1
+        self._count('evictions', method, evicted)
+
+    def _enforce_budget(self):
+        """
+        Evict least recently used entries, across all methods, until the
+        total payload size is within ``max_bytes``
+        """
+        with self._budget_lock:
+            while self._bytes > self.max_bytes:
+                oldest = None
+                for method in list(self._caches):
+                    with self._lock(method):
+                        cache = self._caches[method]
+                        key = _clock_victim(cache)
+                        if key is None:
+                            continue
+                        tick = cache[key].accessed
+                    if oldest is None or tick < oldest[0]:
+                        oldest = (tick, method, key)
+                if oldest is None:
+                    break
+                tick, method, key = oldest
+                with self._lock(method):
+                    if self._delete(method, key):
+                        self._count('evictions', method)
+
+    def _add_bytes(self, size):
+        with self._bytes_lock:
+            self._bytes += size
+
+    @property
+    def total_bytes(self):
+        return self._bytes
 
     def _delete(self, method, key):
-        try:
-            del self._caches[method][key]
-        except KeyError:
-            pass
-        try:
-            del self._expire_info[method][key]
-        except KeyError:
-            pass
+        # caller holds the method's lock
+        entry = self._caches[method].pop(key, None)
+        if entry is None:
+            return False
+        if entry.tags:
+            self._untag(entry.tags, method, key)
+        self._add_bytes(-entry.size)
+        return True
+
+    def _untag(self, tags, method, key):
+        with self._tags_lock:
+            for tag in tags:
+                keys = self._tag_index.get(tag)
+                if keys is not None:
+                    keys.discard((method, key))
+                    if not keys:
+                        del self._tag_index[tag]
+
+    def _count(self, counter, method, n=1):
+        with self._stats_lock:
+            getattr(self, counter)[method] += n
+
+    def stats(self, reset=False):
+        """
+        Per-method statistics: counts of hits (including stale and negative
+        hits), misses, expirations, evictions, invalidations, revalidations,
+        coalesced fetches and backend hits, the current number of entries and their
+        approximate size in bytes, and the mean and 99th percentile time, in
+        seconds, spent storing (dump) and loading (load) values over the last
+        STATS_SAMPLES operations
+        :param reset: zero the counters and timings after reading them
+        :return: dict of method name -> dict of statistics
+        """
+        # sized before taking the stats lock, which is taken while holding
+        # method locks
+        sizes = {}
+        for method in list(self._caches):
+            with self._lock(method):
+                entries = self._caches[method].values()
+                sizes[method] = (len(entries), sum(e.size for e in entries))
+
+        with self._stats_lock:
+            methods = set(sizes)
+            for counter in _COUNTERS:
+                methods.update(getattr(self, counter))
+            stats = {}
+            for method in methods:
+                stats[method] = method_stats = {}
+                for counter in _COUNTERS:
+                    method_stats[counter] = getattr(self, counter).get(method, 0)
+                method_stats['entries'], method_stats['bytes'] = \
+                    sizes.get(method, (0, 0))
+                for name, times in (('dump', self._dump_times),
+                                    ('load', self._load_times)):
+                    mean, p99 = _summarize(times.get(method, ()))
+                    method_stats[name + '_mean'] = mean
+                    method_stats[name + '_p99'] = p99
+            if reset:
+                self._reset_stats()
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._reset_stats()
+
+    def _reset_stats(self):
+        for counter in _COUNTERS:
+            getattr(self, counter).clear()
+        self._dump_times.clear()
+        self._load_times.clear()
 
     def clear(self, method=None):
+        """
+        Delete all entries, or those of ``method``, from memory and the
+        backend. Each method's entries are swapped out at once, so concurrent
+        readers see either the old entries or none.
+        """
+        if self.backend is not None:
+            self.backend.clear(method)
+
+        methods = [method] if method is not None else list(self._caches)
+        for name in methods:
+            with self._lock(name):
+                cleared = self._caches[name]
+                self._caches[name] = OrderedDict()
+                self._add_bytes(-sum(e.size for e in cleared.values()))
+                for key, entry in cleared.items():
+                    if entry.tags:
+                        self._untag(entry.tags, name, key)
+
+        # drop the cleared entries' expirations, keeping any set since
+        with self._heap_lock:
+            self._compact_heap(set(methods))
+
+
+def _clock_victim(cache):
+    """
+    Find the next entry to evict, giving entries that have been read since
+    the last pass a second chance at the back of the line. Caller holds the
+    method's lock.
+    :return: key, or None if ``cache`` is empty
+    """
+    for i in range(len(cache)):
+        key = next(iter(cache))
+        entry = cache[key]
+        if not entry.referenced:
+            return key
+        entry.referenced = False
+        _move_to_end(cache, key)
+    return next(iter(cache), None)
+
+
+def _is_current(cache, heap_item):
+    until, tick, method, key = heap_item
+    entry = cache._caches.get(method, {}).get(key)
+    return entry is not None and entry.stale_until == until
+
+
+_COUNTERS = ('hits', 'stale_hits', 'negative_hits', 'misses', 'expirations',
+             'evictions', 'invalidations', 'revalidations', 'coalesced',
+             'backend_hits', 'warm_start_hits', 'cross_process_hits')
+
+def _summarize(times):
+    """
+    :return: (mean, 99th percentile) of a sequence of durations, or
+             (None, None) if it's empty
+    """
+    times = sorted(times)
+    if not times:
+        return None, None
+    p99 = times[min(len(times) - 1, int(math.ceil(0.99 * len(times))) - 1)]
+    return sum(times) / len(times), p99
+
+
+def _start_sweeper(cache):
+    # the thread only holds a weak reference so the cache can still be
+    # garbage collected; the thread exits when it is
+    cache_ref = weakref.ref(cache)
+    interval = cache.sweep_interval
 
-        if method is not None:
-            methods = [method]
-        else:
-            methods = self._caches.keys()
+    def _sweep():
+        while True:
+            time.sleep(interval)
+            cache = cache_ref()
+            if cache is None:
+                return
+            cache.sweep()
+            del cache
 
-        for method in methods:
-            self._caches[method].clear()
-            self._expire_info[method].clear()
+    t = threading.Thread(target=_sweep, name="pyhorn-cache-sweeper")
+    t.daemon = True
+    t.start()
+    return t
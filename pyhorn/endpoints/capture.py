@@ -1,7 +1,7 @@
 
 import six
 from .base import Endpoint, EndpointObj
-from .cache import cached
+from .cache import cached, tag_by
 
 if six.PY3:
     from urllib.parse import urljoin, quote
@@ -16,6 +16,8 @@ class CaptureEndpoint(Endpoint):
     _kwarg_map = {}
 
     @classmethod
+    @cached(ttl=10, stale_ttl=20, max_entries=1, listing=True,
+            tags=tag_by('agent', 'name'))
     def agents(cls, client):
         resp_data = client.get('/capture-admin/agents.json')
         if not isinstance(resp_data['agents'], dict) \
@@ -27,13 +29,14 @@ class CaptureEndpoint(Endpoint):
         return agents
 
     @classmethod
-    @cached(ttl=30)
+    @cached(ttl=30, stale_ttl=30, negative_ttl=10, tags=tag_by('agent', 'name'))
     def agent(cls, client, agent_name):
         resp_data = client.get('/capture-admin/agents/%s.json' % agent_name)
         return resp_data['agent-state-update']
 
 
 class CaptureAgent(EndpointObj):
+    __slots__ = ()
 
     def __repr__(self):
         return "Capture Agent %s" % self.name
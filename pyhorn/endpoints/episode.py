@@ -1,7 +1,7 @@
 
 import six
 from .base import Endpoint, EndpointObj
-from .cache import cached
+from .cache import cached, tag_by
 from .workflow import WorkflowEndpoint, Workflow
 
 if six.PY3:
@@ -44,7 +44,8 @@ class EpisodeEndpoint(Endpoint):
         return eps
 
     @classmethod
-    @cached(ttl=300, max_entries=1000)
+    @cached(ttl=300, max_entries=1000, negative_ttl=60,
+            tags=tag_by('mediapackage', 'id'))
     def episode(cls, client, episode_id):
         ep_search = EpisodeEndpoint.episodes(client, id=episode_id)
         if len(ep_search) == 0:
@@ -52,9 +53,10 @@ class EpisodeEndpoint(Endpoint):
         return ep_search[0]
 
 class MediaTrack(EndpointObj):
-    pass
+    __slots__ = ()
 
 class Mediapackage(EndpointObj):
+    __slots__ = ()
 
     def __repr__(self):
         return "Mediapackage %s" % self.id
@@ -72,6 +74,7 @@ class Mediapackage(EndpointObj):
 
 
 class Episode(EndpointObj):
+    __slots__ = ()
 
     def __repr__(self):
         return "Episode %s" % self.id
@@ -2,7 +2,7 @@
 import six
 from .base import Endpoint
 from .episode import Episode
-from .cache import cached
+from .cache import cached, tag_by
 
 if six.PY3:
     from urllib.parse import urljoin, quote
@@ -42,7 +42,8 @@ class SearchEndpoint(Endpoint):
         return eps
 
     @classmethod
-    @cached(ttl=300, max_entries=1000)
+    @cached(ttl=300, max_entries=1000, negative_ttl=60,
+            tags=tag_by('mediapackage', 'id'))
     def episode(cls, client, episode_id):
         ep_search = SearchEndpoint.episodes(client, id=episode_id)
         if len(ep_search) == 0:
@@ -50,6 +51,7 @@ class SearchEndpoint(Endpoint):
         return ep_search[0]
 
 class SearchEpisode(Episode):
+    __slots__ = ()
 
     @property
     def url(self):
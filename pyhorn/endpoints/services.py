@@ -1,6 +1,7 @@
 
 import six
 from .base import Endpoint, EndpointObj
+from .cache import cached, state_ttl, tag_by, TERMINAL_TTL
 
 if six.PY3:
     from urllib.parse import urljoin
@@ -10,6 +11,10 @@ else:
 __all__ = ['ServicesEndpoint', 'ServiceJob', 'ServiceHost',
            'ServiceStatistics', 'ServiceRegistration', 'ServiceStatEntry']
 
+# jobs in these states no longer change
+JOB_TERMINAL_STATES = ('FINISHED', 'FAILED', 'CANCELED', 'DELETED')
+_job_ttl = state_ttl('status', JOB_TERMINAL_STATES, TERMINAL_TTL, 10)
+
 
 class ServicesEndpoint(Endpoint):
 
@@ -21,11 +26,15 @@ class ServicesEndpoint(Endpoint):
     }
 
     @classmethod
+    @cached(ttl=10, stale_ttl=20, max_entries=1, listing=True,
+            tags=tag_by('host', 'statistics.service.serviceRegistration.host'))
     def statistics(cls, client):
         resp_data = client.get('/services/statistics.json')
         return resp_data
 
     @classmethod
+    @cached(ttl=30, stale_ttl=30, max_entries=1, listing=True,
+            tags=tag_by('host', 'base_url'))
     def hosts(cls, client):
         resp_data = client.get('/services/hosts.json')
         if 'host' not in resp_data['hosts']:
@@ -36,6 +45,7 @@ class ServicesEndpoint(Endpoint):
         return hosts
 
     @classmethod
+    @cached(ttl=30, max_entries=100, listing=True, tags=tag_by('host', 'host'))
     def services(cls, client, **kwargs):
         params = cls.map_kwargs_to_params('services', kwargs)
         resp_data = client.get('/services/services.json', params)
@@ -47,11 +57,15 @@ class ServicesEndpoint(Endpoint):
         return services
 
     @classmethod
+    @cached(ttl=_job_ttl, negative_ttl=60)
     def job(cls, client, job_id):
         resp_data = client.get('/services/job/%s.json' % str(job_id))
         return resp_data['job']
 
+    # a running job can still spawn children, however finished the current
+    # ones are, and the children don't say what state their parent is in
     @classmethod
+    @cached(ttl=10)
     def children(cls, client, job_id):
         resp_data = client.get('/services/job/%s/children.json' % str(job_id))
         if 'job' not in resp_data['jobs']:
@@ -63,6 +77,7 @@ class ServicesEndpoint(Endpoint):
 
 
 class ServiceStatistics(EndpointObj):
+    __slots__ = ()
 
     @property
     def services(self):
@@ -88,6 +103,7 @@ class ServiceStatistics(EndpointObj):
 
 
 class ServiceStatEntry(EndpointObj):
+    __slots__ = ()
 
     @property
     def registration(self):
@@ -99,9 +115,10 @@ class ServiceStatEntry(EndpointObj):
         return self.registration.type
 
 class ServiceRegistration(EndpointObj):
-    pass
+    __slots__ = ()
 
 class ServiceHost(EndpointObj):
+    __slots__ = ()
 
     @property
     def services(self):
@@ -113,9 +130,10 @@ class ServiceHost(EndpointObj):
         self.client.post('/services/maintenance', data={
                              'host': self.base_url,
                              'maintenance': state
-                         })
+                         }, invalidate_tags='host:%s' % self.base_url)
 
 class ServiceJob(EndpointObj):
+    __slots__ = ()
 
     def __repr__(self):
         return "Job %s" % self.id
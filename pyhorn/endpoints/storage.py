@@ -0,0 +1,191 @@
+"""
+pyhorn.endpoints.storage
+~~~~~~~~~~~~~~
+strategies for how EndpointCache stores response values
+"""
+
+import six
+import sys
+import zlib
+
+if six.PY3:
+    import pickle
+else:
+    import cPickle as pickle
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+__all__ = ['PickleStorage', 'FrozenStorage', 'CompressedStorage',
+           'FrozenDict', 'FrozenList', 'get_storage']
+
+# errors that mean a stored value couldn't be restored; treated as a miss
+LOAD_ERRORS = (pickle.PickleError, zlib.error, EOFError, ValueError)
+
+
+class PickleStorage(object):
+    """
+    Stores a pickled copy of each value; every hit returns a fresh copy
+    """
+
+    name = 'pickle'
+
+    def dump(self, value):
+        """
+        :return: (stored, size in bytes) tuple
+        """
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return pickled, len(pickled)
+
+    def load(self, stored):
+        return pickle.loads(stored)
+
+
+class CompressedStorage(PickleStorage):
+    """
+    Stores each value pickled and compressed, trading CPU on every hit for
+    a smaller memory footprint. Uses lz4 if requested and installed,
+    otherwise zlib.
+    """
+
+    name = 'compressed'
+
+    def __init__(self, codec='zlib', level=6):
+        if codec == 'lz4' and lz4_frame is None:
+            raise ValueError("lz4 codec requires the lz4 package")
+        if codec not in ('zlib', 'lz4'):
+            raise ValueError("unknown compression codec %r" % codec)
+        self.codec = codec
+        self.level = level
+
+    def dump(self, value):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if self.codec == 'lz4':
+            compressed = lz4_frame.compress(pickled)
+        else:
+            compressed = zlib.compress(pickled, self.level)
+        return compressed, len(compressed)
+
+    def load(self, stored):
+        if self.codec == 'lz4':
+            return pickle.loads(lz4_frame.decompress(stored))
+        return pickle.loads(zlib.decompress(stored))
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("cached %s objects are read-only" % self.__class__.__name__)
+
+
+class FrozenDict(dict):
+    """
+    A dict that can't be modified. Still passes ``isinstance(x, dict)``.
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = \
+        update = _read_only
+
+    def __ior__(self, other):
+        _read_only(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class FrozenList(list):
+    """
+    A list that can't be modified. Still passes ``isinstance(x, list)``.
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = append = extend = insert = pop = remove = \
+        reverse = sort = _read_only
+
+    if six.PY3:
+        clear = _read_only
+    else:
+        __setslice__ = __delslice__ = _read_only
+
+    def __iadd__(self, other):
+        _read_only(self)
+
+    def __imul__(self, other):
+        _read_only(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(value):
+    """
+    Make a deeply read-only copy of decoded json data
+    :return: (frozen value, approximate size in bytes) tuple
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        items = []
+        for k, v in value.items():
+            v, v_size = freeze(v)
+            size += v_size + sys.getsizeof(k)
+            items.append((k, v))
+        return FrozenDict(items), size
+    if isinstance(value, (list, tuple)):
+        values = []
+        for v in value:
+            v, v_size = freeze(v)
+            size += v_size
+            values.append(v)
+        return FrozenList(values), size
+    return value, size
+
+
+class FrozenStorage(object):
+    """
+    Stores a deeply frozen (read-only) version of each value and returns it
+    as-is on every hit: no serialization and no copying. Callers must not
+    try to modify cached values; attempts raise TypeError.
+    """
+
+    name = 'frozen'
+
+    def dump(self, value):
+        return freeze(value)
+
+    def load(self, stored):
+        return stored
+
+
+_storages = {
+    'pickle': PickleStorage,
+    'frozen': FrozenStorage,
+    'compressed': CompressedStorage,
+}
+
+def get_storage(storage):
+    """
+    :param storage: a storage instance, a storage name ('pickle', 'frozen' or
+                    'compressed'), or None for the default
+    :return: a storage instance
+    """
+    if storage is None:
+        return PickleStorage()
+    if isinstance(storage, six.string_types):
+        try:
+            return _storages[storage]()
+        except KeyError:
+            raise ValueError("unknown cache storage %r" % storage)
+    return storage
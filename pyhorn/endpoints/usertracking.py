@@ -29,7 +29,14 @@ class UserTrackingEndpoint(Endpoint):
             return [actions]
         return actions
 
+    @classmethod
+    def stream_user_actions(cls, client, **kwargs):
+        params = cls.map_kwargs_to_params('user_actions', kwargs)
+        return client.iter_get('usertracking/actions.json',
+                               ('actions', 'action'), params)
+
 class UserAction(EndpointObj):
+    __slots__ = ()
 
     @property
     def episode(self):
@@ -1,7 +1,7 @@
 
 import six
 from .base import Endpoint, EndpointObj
-from .cache import cached
+from .cache import cached, state_ttl, tag_by, TERMINAL_TTL
 
 if six.PY3:
     from urllib.parse import urljoin
@@ -10,6 +10,10 @@ else:
 
 __all__ = ['WorkflowEndpoint', 'Workflow', 'WorkflowOperation']
 
+# workflows in these states no longer change
+WORKFLOW_TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'STOPPED')
+_workflow_tags = [tag_by('workflow', 'id'), tag_by('mediapackage', 'mediapackage.id')]
+
 class WorkflowEndpoint(Endpoint):
 
     _kwarg_map = {
@@ -37,6 +41,7 @@ class WorkflowEndpoint(Endpoint):
     }
 
     @classmethod
+    @cached(ttl=10, max_entries=100, listing=True, tags=_workflow_tags)
     def instances(cls, client, **kwargs):
         params = cls.map_kwargs_to_params('instances', kwargs)
         resp_data = client.get('workflow/instances.json', params)
@@ -48,13 +53,21 @@ class WorkflowEndpoint(Endpoint):
         return wfs
 
     @classmethod
-    @cached(ttl=60, max_entries=1000)
+    def stream_instances(cls, client, **kwargs):
+        params = cls.map_kwargs_to_params('instances', kwargs)
+        return client.iter_get('workflow/instances.json',
+                               ('workflows', 'workflow'), params)
+
+    @classmethod
+    @cached(ttl=state_ttl('state', WORKFLOW_TERMINAL_STATES, TERMINAL_TTL, 60),
+            stale_ttl=30, max_entries=1000, tags=_workflow_tags)
     def instance(cls, client, instance_id):
         instance_data = client.get('workflow/instance/%s.json' % str(instance_id))
         return instance_data['workflow']
 
 
 class WorkflowOperation(EndpointObj):
+    __slots__ = ()
 
     def __repr__(self):
         return "Operation %s" % self.id
@@ -78,6 +91,7 @@ class WorkflowOperation(EndpointObj):
                                   class_=ServiceJob, single=True)
 
 class Workflow(EndpointObj):
+    __slots__ = ()
 
     def __repr__(self):
         return "Workflow %s" % self.id
@@ -5,8 +5,13 @@ utility functions, yo
 """
 
 from . import __version__
+import re
 import sys
+import json
+import codecs
 import platform
+import threading
+from six.moves import queue
 
 def default_user_agent(name="pyhorn"):
     """Return a string representing the default user agent."""
@@ -52,3 +57,183 @@ def default_headers(use_auth):
         'X-Opencast-Matterhorn-Authorization': 'true'
         })
     return headers
+
+
+class _PageError(object):
+
+    def __init__(self, exc):
+        self.exc = exc
+
+_pages_done = object()
+
+def iter_pages(fetch_page, page_size, read_ahead=1):
+    """
+    Generator over the pages of a listing. Pages are fetched on a background
+    thread, staying up to ``read_ahead`` pages ahead of the consumer, so the
+    next request overlaps with processing of the current page. Iteration stops
+    after the first page holding fewer than ``page_size`` items. Exceptions
+    raised by ``fetch_page`` are re-raised in the consuming thread.
+    :param fetch_page: callable taking a 0-based page number and returning a
+                       list of items
+    :param page_size: expected number of items in a full page
+    :param read_ahead: max number of fetched pages waiting to be consumed
+    :return: generator of item lists
+    """
+    if page_size < 1:
+        raise ValueError("page_size must be a positive integer")
+    if read_ahead < 1:
+        # a Queue with maxsize <= 0 is unbounded
+        raise ValueError("read_ahead must be a positive integer")
+    pages = queue.Queue(maxsize=read_ahead)
+    stopped = threading.Event()
+
+    def _put(item):
+        # don't block forever if the consumer has gone away
+        while not stopped.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _fetch():
+        page_num = 0
+        try:
+            while not stopped.is_set():
+                page = fetch_page(page_num)
+                if not _put(page) or len(page) < page_size:
+                    break
+                page_num += 1
+        except Exception as e:
+            _put(_PageError(e))
+        _put(_pages_done)
+
+    t = threading.Thread(target=_fetch)
+    t.daemon = True
+    t.start()
+
+    try:
+        while True:
+            page = pages.get()
+            if page is _pages_done:
+                break
+            if isinstance(page, _PageError):
+                raise page.exc
+            yield page
+    finally:
+        stopped.set()
+
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+class _JSONReader(object):
+    """
+    Pull parser over a JSON document arriving in chunks. Only the text of
+    the value being read (plus about one chunk) is buffered.
+    """
+
+    def __init__(self, chunks, encoding='utf-8'):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._raw_decode = json.JSONDecoder().raw_decode
+        self.buf = ''
+        self.pos = 0
+
+    def _fill(self):
+        # read more text; buffer positions stay valid
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                self.buf += text
+                return True
+        return False
+
+    def peek(self):
+        """
+        :return: the next non-whitespace character, or '' at the end
+        """
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError("Expected %r at %d, got %r" % (chars, self.pos, c))
+        self.pos += 1
+        return c
+
+    def read_value(self):
+        self.peek()
+        if self.pos > len(self.buf) // 2:
+            # drop what's been consumed
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        eof = False
+        while True:
+            try:
+                value, end = self._raw_decode(self.buf, self.pos)
+            except ValueError:
+                if eof:
+                    raise ValueError("Truncated JSON document")
+            else:
+                # a number at the end of the buffer may continue in the
+                # next chunk
+                if end < len(self.buf) or eof:
+                    self.pos = end
+                    return value
+            # incomplete; read at least as much again before retrying, so
+            # large values aren't re-parsed once per chunk
+            size = len(self.buf) - self.pos
+            while len(self.buf) - self.pos < max(2 * size, 1):
+                if not self._fill():
+                    eof = True
+                    break
+
+
+def iter_json_items(chunks, path, encoding='utf-8'):
+    """
+    Parse a JSON document incrementally and yield each element of the array
+    found at ``path`` as soon as it's complete, so that only about one
+    element is held in memory at a time. A single object in place of the
+    array (as Matterhorn returns for one-item listings) is yielded as is,
+    and a missing last key yields nothing.
+    :param chunks: iterable of byte strings, e.g. ``resp.iter_content(n)``
+    :param path: sequence of object keys leading to the array, e.g.
+                 ``('workflows', 'workflow')``
+    :param encoding: character encoding of the chunks
+    :return: generator of decoded elements
+    """
+    reader = _JSONReader(chunks, encoding)
+    for depth, key in enumerate(path):
+        if reader.peek() != '{':
+            raise ValueError("Expected an object at %r" % (path[:depth],))
+        reader.expect('{')
+        while True:
+            if reader.peek() == '}':
+                if depth < len(path) - 1:
+                    raise KeyError(key)
+                return
+            name = reader.read_value()
+            reader.expect(':')
+            if name == key:
+                break
+            reader.read_value()
+            if reader.peek() == ',':
+                reader.pos += 1
+
+    if reader.peek() != '[':
+        yield reader.read_value()
+        return
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        yield reader.read_value()
+        if reader.expect(',]') == ']':
+            return
@@ -30,13 +30,14 @@ history = read('HISTORY.rst')
 version_file = read('pyhorn/__init__.py')
 version = re.search(r"^__version__ = ['\"]([^'\"]*)['\"]", version_file, re.M).group(1)
 
-install_requires = ["requests", "requests-cache", "arrow", "rwlock", "six"]
+install_requires = ["requests", "requests-cache", "arrow", "six",
+                    'futures; python_version < "3.0"']
 tests_require = ["pytest", "httmock", "mock", "freezegun"]
 
 setup(
     name='pyhorn',
     version=version,
-    packages=find_packages(exclude=["docs", "tests*"]),
+    packages=find_packages(exclude=["docs", "tests*", "benchmarks*"]),
     url='https://bitbucket.org/lbjay/pyhorn',
     license='Apache 2.0',
     author='Jay Luker',
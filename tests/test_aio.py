@@ -0,0 +1,186 @@
+import six
+import pytest
+from six.moves.urllib.parse import urlparse, parse_qs
+from httmock import HTTMock, all_requests
+from pyhorn.endpoints import Workflow, ServiceJob
+from .fixtures import json_fixture
+
+if six.PY3:
+    import asyncio
+    from pyhorn import AsyncMHClient, MHClient
+
+pytestmark = pytest.mark.skipif(six.PY2, reason="asyncio client requires python 3")
+
+def collect(run, agen):
+    # the async generator's items; no async syntax, so this file still
+    # compiles on python 2
+    items = []
+    while True:
+        try:
+            items.append(run(agen.__anext__()))
+        except StopAsyncIteration:
+            return items
+
+@pytest.fixture
+def run():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop.run_until_complete
+    asyncio.set_event_loop(None)
+    loop.close()
+
+@pytest.fixture
+def ac():
+    c = AsyncMHClient('http://matterhorn.example.edu', 'user', 'passwd')
+    yield c
+    c.close()
+
+def test_workflows(run, ac):
+    wfs_data = json_fixture(response_data={
+        "workflows": {"workflow": [{"id": "1"}, {"id": "2"}]}
+    })
+    with HTTMock(wfs_data):
+        wfs = run(ac.workflows())
+    assert [x.id for x in wfs] == ["1", "2"]
+    assert isinstance(wfs[0], Workflow)
+    # wrapped objects still carry the synchronous client for lazy relations
+    assert wfs[0].client is ac.client
+
+def test_gather(run, ac):
+    job_data = json_fixture(r'/services/job/', {"job": {"id": "1"}})
+    with HTTMock(job_data):
+        jobs = run(asyncio.gather(*[ac.job(i) for i in range(10)]))
+    assert len(jobs) == 10
+    assert all(isinstance(x, ServiceJob) for x in jobs)
+
+def test_shared_cache(run, ac):
+    wf_data = json_fixture(response_data={"workflow": {"id": "123"}})
+    with HTTMock(wf_data):
+        run(ac.workflow(123))
+    assert ac.cache is ac.client.cache
+    assert 'WorkflowEndpoint.instance' in ac.cache._caches
+    # served from the cache; no mock in place
+    wf = run(ac.workflow(123))
+    assert wf.id == "123"
+
+def test_related(run, ac):
+    children_data = json_fixture(r'/services/job/1/children', {
+        "jobs": {"job": [{"id": "2"}, {"id": "3"}]}
+    })
+    job = ServiceJob({"id": "1"}, ac.client)
+    with HTTMock(children_data):
+        children = run(ac.related(job, 'children'))
+    assert [x.id for x in children] == ["2", "3"]
+    assert job._property_stash['children'] is children
+
+def test_resolve(run, ac):
+    job_data = json_fixture(r'/services/job/', {"job": {"id": "1"}})
+    wfs = [Workflow({"id": str(i)}, ac.client) for i in range(3)]
+    with HTTMock(job_data):
+        run(ac.resolve(wfs, 'job'))
+    assert all('job' in wf._property_stash for wf in wfs)
+
+def test_iter_workflows(run, ac):
+    requested_pages = []
+
+    @all_requests
+    def resp_page(url, request):
+        params = parse_qs(urlparse(request.url).query)
+        page = int(params['startPage'][0])
+        count = int(params['count'][0])
+        requested_pages.append(page)
+        ids = range(page * count, min(page * count + count, 25))
+        return {'status_code': 200,
+                'content': {'workflows': {'workflow': [{'id': i} for i in ids]}},
+                'headers': {'content-type': 'application/json'}}
+
+    with HTTMock(resp_page):
+        wfs = collect(run, ac.iter_workflows(page_size=10))
+    assert [x.id for x in wfs] == list(range(25))
+    assert requested_pages == [0, 1, 2]
+
+def test_iter_workflows_early_exit(run, ac):
+    wfs_data = json_fixture(response_data={
+        "workflows": {"workflow": [{"id": i} for i in range(10)]}
+    })
+
+    with HTTMock(wfs_data):
+        wfs = ac.iter_workflows(page_size=10)
+        wf = run(wfs.__anext__())
+        run(wfs.aclose())
+    assert wf.id == 0
+
+def test_iter_workflows_closed_client(run):
+    wfs_data = json_fixture(response_data={
+        "workflows": {"workflow": [{"id": i} for i in range(10)]}
+    })
+    closed = []
+
+    def iter_workflows(*args, **kwargs):
+        try:
+            for wf in MHClient.iter_workflows(ac.client, *args, **kwargs):
+                yield wf
+        finally:
+            closed.append(True)
+
+    # breaking out of the loop inside ``async with`` finalizes the async
+    # generator after the client, and its executor, are closed
+    ac = AsyncMHClient('http://matterhorn.example.edu', 'user', 'passwd')
+    ac.client.iter_workflows = iter_workflows
+    run(ac.__aenter__())
+    with HTTMock(wfs_data):
+        wfs = ac.iter_workflows(page_size=10)
+        wf = run(wfs.__anext__())
+    run(ac.__aexit__(None, None, None))
+    run(wfs.aclose())
+    assert wf.id == 0
+    assert closed == [True]
+
+def test_iter_offset_pages(run, ac):
+    requested = []
+
+    @all_requests
+    def resp_page(url, request):
+        params = parse_qs(urlparse(request.url).query)
+        limit = int(params['limit'][0])
+        offset = int(params['offset'][0])
+        requested.append((limit, offset))
+        ids = range(offset, min(offset + limit, 45))
+        return {'status_code': 200,
+                'content': {'actions': {'action': [{'id': i} for i in ids]}},
+                'headers': {'content-type': 'application/json'}}
+
+    with HTTMock(resp_page):
+        actions = collect(run, ac.iter_user_actions(page_size=20, offset=5))
+    assert [x.id for x in actions] == list(range(5, 45))
+    assert requested == [(20, 5), (20, 25), (20, 45)]
+
+def test_iter_episodes(run, ac):
+    @all_requests
+    def resp_page(url, request):
+        params = parse_qs(urlparse(request.url).query)
+        offset = int(params['offset'][0])
+        ids = range(offset, min(offset + int(params['limit'][0]), 15))
+        return {'status_code': 200,
+                'content': {'search-results': {'result': [{'id': i} for i in ids]}},
+                'headers': {'content-type': 'application/json'}}
+
+    with HTTMock(resp_page):
+        eps = collect(run, ac.iter_episodes(page_size=10))
+        search_eps = collect(run, ac.iter_search_episodes(page_size=10))
+    assert [x.id for x in eps] == list(range(15))
+    assert [x.id for x in search_eps] == list(range(15))
+
+def test_stream_workflows(run, ac):
+    wfs_data = json_fixture(response_data={
+        "workflows": {"workflow": [{"id": i} for i in range(25)]}
+    })
+    actions_data = json_fixture(response_data={
+        "actions": {"action": [{"id": i} for i in range(5)]}
+    })
+    with HTTMock(wfs_data):
+        wfs = collect(run, ac.stream_workflows(batch_size=10, count=25))
+    with HTTMock(actions_data):
+        actions = collect(run, ac.stream_user_actions(fields=['id']))
+    assert [x.id for x in wfs] == list(range(25))
+    assert [x.id for x in actions] == list(range(5))
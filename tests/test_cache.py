@@ -1,22 +1,57 @@
+import os
+import sys
 import six
+import time
+import subprocess
 import datetime
+import threading
 import mock
 import pytest
+import requests
 from freezegun import freeze_time
-from pyhorn.endpoints import cache, base
+from pyhorn.endpoints import cache, base, backends
 
 if six.PY3:
     import pickle
 else:
     import cPickle as pickle
 
-@pytest.mark.parametrize("args,kwargs,expected", [
-    ([1], {'foo': 1}, ([1], frozenset(set([('foo', 1)])))),
-    (["id"], {}, (["id"], frozenset({}))),
-    (["12345", True], {"foo": 1, "bar": 2}, (["12345", True], frozenset(set([('foo', 1),('bar',2)]))))
+class KeyEndpoint(base.Endpoint):
+    _kwarg_map = {'listing': {'state': None, 'count': 0, 'compact': None}}
+
+def single(cls, client, item_id, detail=False):
+    pass
+
+def listing(cls, client, **kwargs):
+    pass
+
+@pytest.mark.parametrize("func,calls", [
+    (single, [(('abc',), {}), ((), {'item_id': 'abc'}), (('abc', False), {}),
+              (('abc',), {'detail': False})]),
+    (listing, [((), {}), ((), {'count': 0}), ((), {'state': None}),
+               ((), {'unknown': 1})]),
+    (listing, [((), {'state': ['RUNNING', 'PAUSED']}),
+               ((), {'state': ('RUNNING', 'PAUSED'), 'count': 0})]),
+    (listing, [((), {'compact': True}), ((), {'compact': 'true'})]),
 ])
-def test_key_generator(args, kwargs, expected):
-    assert cache._generate_cache_key(args, kwargs) == expected
+def test_key_generator(func, calls):
+    make_key = cache._key_generator(func, func.__name__)
+    keys = [make_key(KeyEndpoint, None, args, kwargs) for (args, kwargs) in calls]
+    assert all(key == keys[0] for key in keys)
+    hash(keys[0])
+
+def test_key_generator_distinct():
+    make_key = cache._key_generator(listing, 'listing')
+    keys = set([
+        make_key(KeyEndpoint, None, (), {}),
+        make_key(KeyEndpoint, None, (), {'count': 10}),
+        make_key(KeyEndpoint, None, (), {'state': ['RUNNING']}),
+        make_key(KeyEndpoint, None, (), {'state': {'a': [1, 2]}}),
+        make_key(KeyEndpoint, None, (), {'state': {'a': [2, 1]}}),
+    ])
+    assert len(keys) == 5
+    assert cache._key_generator(single, 'single')(KeyEndpoint, None, ('abc',), {}) \
+        == (('detail', False), ('item_id', 'abc'))
 
 @pytest.fixture
 def c():
@@ -42,27 +77,48 @@ def test_cache_enabled(mock_client):
     res = foo(object, mock_client, 'id')
     assert 'object.foo' in mock_client.cache._caches
 
+def test_cache_equivalent_calls(mock_client):
+    foo(object, mock_client, 'id')
+    foo(object, mock_client, foo_id='id')
+    assert len(mock_client.cache._caches['object.foo']) == 1
+    assert mock_client.cache.hits['object.foo'] == 1
+
+def test_cache_listing(mock_client):
+    calls = []
+
+    @cache.cached(10, listing=True)
+    def things(cls, client, **kwargs):
+        calls.append(kwargs)
+        return []
+
+    mock_client.cache_listings = False
+    things(object, mock_client, state=['a', 'b'])
+    things(object, mock_client, state=['a', 'b'])
+    assert len(calls) == 2
+    mock_client.cache_listings = True
+    things(object, mock_client, state=['a', 'b'])
+    things(object, mock_client, state=('a', 'b'))
+    assert len(calls) == 3
+
 def test_cache_set(c):
         c.set('foo', 'bar', 1)
         assert len(c._caches['foo']) == 1
         assert 'bar' in c._caches['foo']
-        assert pickle.loads(c._caches['foo']['bar']) == 1
+        assert pickle.loads(c._caches['foo']['bar'].stored) == 1
 
         c.set('foo', 'bar', 2)
         assert len(c._caches['foo']) == 1
         assert 'bar' in c._caches['foo']
-        assert pickle.loads(c._caches['foo']['bar']) == 2
+        assert pickle.loads(c._caches['foo']['bar'].stored) == 2
 
 def test_cache_set_ttl(c):
     with freeze_time('2016-04-18 00:00:00'):
         c.set('foo', 'bar', 1)
-        assert 'bar' in c._expire_info['foo']
-        assert c._expire_info['foo']['bar'] == 1460937600.0 + cache.DEFAULT_TTL
+        assert c._caches['foo']['bar'].expires == 1460937600.0 + cache.DEFAULT_TTL
 
         c.set('foo', 'bar', 2, ttl=1000)
-        assert pickle.loads(c._caches['foo']['bar']) == 2
-        assert 'bar' in c._expire_info['foo']
-        assert c._expire_info['foo']['bar'] == 1460937600.0 + 1000
+        assert pickle.loads(c._caches['foo']['bar'].stored) == 2
+        assert c._caches['foo']['bar'].expires == 1460937600.0 + 1000
 
 def test_cache_set_max_entries(c):
     with mock.patch.object(c, '_cull') as mock_cull:
@@ -109,4 +165,566 @@ def test_cull(c):
         c.set('foo', str(i), i)
     assert len(c._caches['foo']) == 100
     c._cull('foo')
-    assert len(c._caches['foo']) == 66
+    assert len(c._caches['foo']) == 99
+    assert '0' not in c._caches['foo']
+    c._cull('foo', 9)
+    assert len(c._caches['foo']) == 90
+    assert list(c._caches['foo'])[0] == '10'
+
+def test_lru_eviction(c):
+    for i in range(3):
+        c.set('foo', str(i), i, max_entries=3)
+    # touch the oldest entry so it becomes the most recently used
+    assert c.get('foo', '0') == 0
+    c.set('foo', '3', 3, max_entries=3)
+    assert sorted(c._caches['foo']) == ['0', '2', '3']
+    # re-setting an existing key doesn't evict anything
+    c.set('foo', '3', 4, max_entries=3)
+    assert sorted(c._caches['foo']) == ['0', '2', '3']
+
+def test_byte_budget():
+    c = cache.EndpointCache(max_bytes=3000)
+    payload = 'x' * 900
+    c.set('foo', 'a', payload)
+    c.set('bar', 'b', payload)
+    c.set('foo', 'c', payload)
+    assert c.total_bytes <= 3000
+    assert c.get('foo', 'a') == payload
+    # pushes out the least recently used entry across all methods, 'bar.b'
+    c.set('bar', 'd', payload)
+    assert c.total_bytes <= 3000
+    assert 'b' not in c._caches['bar']
+    assert set(c._caches['foo']) == set(['a', 'c'])
+    c.clear()
+    assert c.total_bytes == 0
+
+def test_clear_drops_expirations(c):
+    c.set('foo', 'a', 1)
+    c.set('bar', 'b', 2)
+    c.clear('foo')
+    assert [item[2:] for item in c._expiry_heap] == [('bar', 'b')]
+    c.set('foo', 'a', 1)
+    c.clear('bar')
+    assert [item[2:] for item in c._expiry_heap] == [('foo', 'a')]
+
+def test_clear_concurrent():
+    c = cache.EndpointCache(sweep_interval=None)
+    stop = threading.Event()
+
+    def churn():
+        i = 0
+        while not stop.is_set():
+            c.set('foo', i % 50, i, max_entries=40, tags=['n:%d' % (i % 7)])
+            c.lookup('foo', (i * 7) % 50)
+            i += 1
+
+    def clear():
+        for i in range(50):
+            c.clear('foo')
+            c.clear()
+            time.sleep(0.001)
+        stop.set()
+        return True
+
+    workers = [threading.Thread(target=churn) for i in range(4)]
+    for t in workers:
+        t.start()
+    results, errors = _run_concurrently(clear, n=1)
+    for t in workers:
+        t.join()
+    assert errors == [] and results == [True]
+    assert len(c._caches['foo']) <= 40
+    assert c.total_bytes == sum(e.size for e in c._caches['foo'].values())
+    c.clear()
+    assert c.total_bytes == 0
+    assert dict(c._tag_index) == {}
+
+def _run_concurrently(func, n=20):
+    results, errors = [], []
+    def call():
+        try:
+            results.append(func())
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=call) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+def test_fetch_coalesced(mock_client):
+    calls = []
+
+    @cache.cached(10, 100)
+    def slow(cls, client, foo_id):
+        calls.append(foo_id)
+        time.sleep(0.2)
+        return {'id': foo_id}
+
+    results, errors = _run_concurrently(lambda: slow(object, mock_client, 'id'))
+    assert len(calls) == 1
+    assert errors == []
+    assert results == [{'id': 'id'}] * 20
+    assert mock_client.cache.coalesced['object.slow'] == 19
+    assert mock_client.cache._flights == {}
+
+def test_fetch_coalesced_error(mock_client):
+    calls = []
+
+    @cache.cached(10, 100)
+    def failing(cls, client, foo_id):
+        calls.append(foo_id)
+        time.sleep(0.2)
+        raise ValueError(foo_id)
+
+    results, errors = _run_concurrently(lambda: failing(object, mock_client, 'id'))
+    assert len(calls) == 1
+    assert results == []
+    assert len(errors) == 20
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert mock_client.cache.get('object.failing', (('foo_id', 'id'),)) is None
+
+def test_fetch_interrupted(mock_client):
+    calls = []
+
+    @cache.cached(10, 100)
+    def interrupted(cls, client, foo_id):
+        calls.append(foo_id)
+        if len(calls) == 1:
+            raise KeyboardInterrupt()
+        return {'id': foo_id}
+
+    with pytest.raises(KeyboardInterrupt):
+        interrupted(object, mock_client, 'id')
+    assert mock_client.cache._flights == {}
+    # not left waiting on the interrupted fetch
+    assert interrupted(object, mock_client, 'id') == {'id': 'id'}
+    assert len(calls) == 2
+
+def test_stale_while_revalidate(mock_client):
+    calls = []
+
+    @cache.cached(ttl=10, stale_ttl=20)
+    def counter(cls, client, foo_id):
+        calls.append(foo_id)
+        return len(calls)
+
+    with freeze_time('2010-12-09 00:00:00') as ft:
+        assert counter(object, mock_client, 'id') == 1
+
+        # past the stale window: blocking fetch
+        ft.tick(datetime.timedelta(seconds=31))
+        assert counter(object, mock_client, 'id') == 2
+
+        # expired but within the stale window: stale value, background refresh
+        ft.tick(datetime.timedelta(seconds=15))
+        assert counter(object, mock_client, 'id') == 2
+        mock_client.cache._refresher.shutdown(wait=True)
+        assert len(calls) == 3
+        assert counter(object, mock_client, 'id') == 3
+
+def test_stale_entry_not_fresh(c):
+    with freeze_time('2010-12-09 00:00:00') as ft:
+        c.set('foo', 'bar', 300, ttl=10, stale_ttl=10)
+        ft.tick(datetime.timedelta(seconds=15))
+        assert c.get('foo', 'bar') is None
+        assert c.lookup('foo', 'bar') == (300, True)
+        ft.tick(datetime.timedelta(seconds=5))
+        assert c.lookup('foo', 'bar') == (None, False)
+        assert 'bar' not in c._caches['foo']
+
+def test_early_refresh(c):
+    with freeze_time('2010-12-09 00:00:00') as ft:
+        c.set('foo', 'bar', 300, ttl=10, delta=2)
+        with mock.patch('random.random', return_value=0.5):
+            # -2 * ln(0.5) ~= 1.4s early
+            assert c.lookup('foo', 'bar', early_refresh=1) == (300, False)
+            ft.tick(datetime.timedelta(seconds=9))
+            assert c.lookup('foo', 'bar', early_refresh=1) == (300, True)
+            assert c.lookup('foo', 'bar', early_refresh=0) == (300, False)
+
+def test_sweep(c):
+    with freeze_time('2010-12-09 00:00:00') as ft:
+        c.set('foo', 'a', 1, ttl=10)
+        c.set('foo', 'b', 2, ttl=20)
+        c.set('bar', 'c', 3, ttl=10, stale_ttl=20)
+        ft.tick(datetime.timedelta(seconds=15))
+        assert c.sweep() == 1
+        assert list(c._caches['foo']) == ['b']
+        # re-set entries get their new expiration
+        c.set('foo', 'b', 2, ttl=100)
+        ft.tick(datetime.timedelta(seconds=20))
+        assert c.sweep() == 1
+        assert list(c._caches['foo']) == ['b']
+        assert len(c._caches['bar']) == 0
+
+def test_sweep_soak():
+    """
+    One-off keys that are never read again must not accumulate
+    """
+    c = cache.EndpointCache(sweep_interval=None)
+    sizes = []
+    with freeze_time('2010-12-09 00:00:00') as ft:
+        for minute in range(120):
+            for i in range(50):
+                c.set('EpisodeEndpoint.episode', '%d-%d' % (minute, i), {'id': i},
+                      ttl=300)
+            ft.tick(datetime.timedelta(seconds=60))
+            sizes.append(len(c._caches['EpisodeEndpoint.episode']))
+    # 5 minutes' worth of entries at most, despite 6000 sets
+    assert max(sizes) <= 300
+    assert sizes[-1] == sizes[-30]
+    assert len(c._expiry_heap) <= 300 + cache.SWEEP_BATCH
+
+    # long-lived entries that are evicted, or renewed, long before they
+    # expire don't leave their expirations behind either
+    c = cache.EndpointCache(sweep_interval=None)
+    for i in range(20000):
+        c.set('WorkflowEndpoint.instance', i, {'id': i}, ttl=cache.TERMINAL_TTL,
+              max_entries=500)
+    assert len(c._caches['WorkflowEndpoint.instance']) == 500
+    assert len(c._expiry_heap) <= cache.HEAP_COMPACT_MIN + 1
+    for i in range(20000):
+        c.extend('WorkflowEndpoint.instance', 19999, ttl=3600)
+    assert len(c._expiry_heap) <= cache.HEAP_COMPACT_MIN + 1
+    # every entry's current expiration is kept
+    current = [item[3] for item in c._expiry_heap if cache._is_current(c, item)]
+    assert sorted(current) == sorted(c._caches['WorkflowEndpoint.instance'])
+
+def test_sweeper_thread():
+    c = cache.EndpointCache(sweep_interval=0.05)
+    c.set('foo', 'bar', 1, ttl=0.01)
+    assert c._sweeper.is_alive()
+    time.sleep(0.2)
+    assert len(c._caches['foo']) == 0
+
+def test_frozen_storage():
+    c = cache.EndpointCache(storage='frozen')
+    c.set('foo', 'bar', {'id': 1, 'ops': [{'id': 'a'}]})
+    value = c.get('foo', 'bar')
+    assert value == {'id': 1, 'ops': [{'id': 'a'}]}
+    assert isinstance(value, dict)
+    assert isinstance(value['ops'], list)
+    # no copying: every hit returns the same object
+    assert c.get('foo', 'bar') is value
+    with pytest.raises(TypeError):
+        value['id'] = 2
+    with pytest.raises(TypeError):
+        value['ops'].append({})
+    with pytest.raises(TypeError):
+        value['ops'][0].update({'id': 'b'})
+    assert pickle.loads(pickle.dumps(value)) == value
+    assert c.total_bytes > 0
+
+def test_compressed_storage():
+    c = cache.EndpointCache(storage='compressed')
+    value = {'id': 1, 'doc': 'x' * 10000}
+    c.set('foo', 'bar', value)
+    assert c.get('foo', 'bar') == value
+    assert c.get('foo', 'bar') is not c.get('foo', 'bar')
+    assert c.total_bytes < 1000
+
+def test_bad_storage():
+    with pytest.raises(ValueError):
+        cache.EndpointCache(storage='foo')
+
+@pytest.fixture
+def db_path(tmpdir):
+    return str(tmpdir.join('cache.db'))
+
+def test_backend_key():
+    key = ((1,), frozenset(('k%d' % i, i) for i in range(20)))
+    other = ((1,), frozenset(('k%d' % i, i) for i in reversed(range(20))))
+    assert backends.backend_key(key) == backends.backend_key(other)
+    assert backends.backend_key(key) != backends.backend_key(((2,), key[1]))
+
+def test_backend_warm_start(db_path):
+    c1 = cache.EndpointCache(backend=backends.SQLiteCacheBackend(db_path))
+    c1.set('foo', 'bar', {'id': 1})
+    assert c1.backend_hits['foo'] == 0
+
+    c2 = cache.EndpointCache(backend=backends.SQLiteCacheBackend(db_path))
+    assert c2.get('foo', 'bar') == {'id': 1}
+    assert c2.backend_hits['foo'] == 1
+    assert c2.warm_start_hits['foo'] == 1
+    assert c2.cross_process_hits['foo'] == 0
+    # now in memory
+    assert c2.get('foo', 'bar') == {'id': 1}
+    assert c2.backend_hits['foo'] == 1
+
+def test_backend_cross_process(db_path):
+    c = cache.EndpointCache(backend=backends.SQLiteCacheBackend(db_path))
+    script = ("from pyhorn.endpoints import cache, backends; "
+              "c = cache.EndpointCache(backend=backends.SQLiteCacheBackend(%r)); "
+              "c.set('foo', ((1,), frozenset([('a', 1), ('b', 2)])), 'baz')" % db_path)
+    subprocess.check_call([sys.executable, '-c', script],
+                          cwd=os.path.dirname(os.path.dirname(__file__)))
+    assert c.get('foo', ((1,), frozenset([('b', 2), ('a', 1)]))) == 'baz'
+    assert c.cross_process_hits['foo'] == 1
+    assert c.warm_start_hits['foo'] == 0
+
+def test_backend_ttl(db_path):
+    c1 = cache.EndpointCache(backend=backends.SQLiteCacheBackend(db_path))
+    c2 = cache.EndpointCache(backend=backends.SQLiteCacheBackend(db_path))
+    with freeze_time('2016-04-18 00:00:00'):
+        c1.set('foo', 'bar', 1, ttl=60, stale_ttl=60)
+    with freeze_time('2016-04-18 00:01:30'):
+        # stale entries come back marked for refresh
+        assert c2.get('foo', 'bar') is None
+        assert c2.lookup('foo', 'bar') == (1, True)
+    with freeze_time('2016-04-18 00:02:01'):
+        c3 = cache.EndpointCache(backend=backends.SQLiteCacheBackend(db_path))
+        assert c3.lookup('foo', 'bar') == (None, False)
+
+def test_backend_extend(db_path):
+    c1 = cache.EndpointCache(backend=backends.SQLiteCacheBackend(db_path))
+    with freeze_time('2016-04-18 00:00:00'):
+        c1.set('MHClient.get', 'url', ('etag', None, {}), ttl=3600)
+    with freeze_time('2016-04-18 00:50:00'):
+        assert c1.extend('MHClient.get', 'url', 3600)
+    # other processes and warm starts see the renewed expiration
+    with freeze_time('2016-04-18 01:30:00'):
+        c2 = cache.EndpointCache(backend=backends.SQLiteCacheBackend(db_path))
+        assert c2.get('MHClient.get', 'url') == ('etag', None, {})
+
+def test_backend_max_entries(db_path):
+    backend = backends.SQLiteCacheBackend(db_path)
+    c = cache.EndpointCache(backend=backend)
+    for i in range(5):
+        c.set('foo', i, i, max_entries=3)
+    assert [backend.get('foo', i) is not None for i in range(5)] == \
+        [False, False, True, True, True]
+
+def test_backend_clear(db_path):
+    backend = backends.SQLiteCacheBackend(db_path)
+    c = cache.EndpointCache(backend=backend)
+    c.set('foo', 'bar', 1)
+    c.set('baz', 'bar', 1)
+    c.clear('foo')
+    assert backend.get('foo', 'bar') is None
+    assert backend.get('baz', 'bar') is not None
+    c.clear()
+    assert backend.get('baz', 'bar') is None
+
+def test_stats():
+    c = cache.EndpointCache(sweep_interval=None)
+    with freeze_time('2016-04-18 00:00:00'):
+        assert c.get('foo', 'bar') is None
+        c.set('foo', 'bar', {'id': 1}, ttl=10, stale_ttl=10)
+        c.get('foo', 'bar')
+        c.get('foo', 'bar')
+        for i in range(3):
+            c.set('baz', i, i, max_entries=2)
+    with freeze_time('2016-04-18 00:00:15'):
+        assert c.lookup('foo', 'bar') == ({'id': 1}, True)
+    with freeze_time('2016-04-18 00:00:30'):
+        assert c.lookup('foo', 'bar') == (None, False)
+
+    stats = c.stats()
+    foo = stats['foo']
+    assert (foo['hits'], foo['stale_hits'], foo['misses']) == (3, 1, 2)
+    assert (foo['expirations'], foo['evictions']) == (1, 0)
+    assert (foo['entries'], foo['bytes']) == (0, 0)
+    assert foo['dump_p99'] >= foo['dump_mean'] >= 0
+    assert foo['load_p99'] is not None
+    baz = stats['baz']
+    assert (baz['evictions'], baz['entries']) == (1, 2)
+    assert baz['bytes'] == c.total_bytes
+    assert baz['load_mean'] is None
+
+def test_stats_reset(c):
+    c.set('foo', 'bar', 1)
+    c.get('foo', 'bar')
+    assert c.stats(reset=True)['foo']['hits'] == 1
+    stats = c.stats()['foo']
+    assert stats['hits'] == 0
+    assert stats['dump_mean'] is None
+    # entries aren't affected
+    assert stats['entries'] == 1
+    c.get('foo', 'bar')
+    c.reset_stats()
+    assert c.stats()['foo']['hits'] == 0
+
+@pytest.mark.parametrize("times,expected", [
+    ([], (None, None)),
+    ([1.0], (1.0, 1.0)),
+    ([float(i) for i in range(1, 201)], (100.5, 198.0)),
+])
+def test_summarize(times, expected):
+    assert cache._summarize(times) == expected
+
+def test_negative_cache(mock_client):
+    calls = []
+
+    @cache.cached(ttl=100, negative_ttl=10)
+    def lookup(cls, client, foo_id):
+        calls.append(foo_id)
+        return None
+
+    with freeze_time('2016-04-18 00:00:00'):
+        assert lookup(object, mock_client, 'id') is None
+        assert lookup(object, mock_client, 'id') is None
+        assert len(calls) == 1
+        # distinguishable from a miss
+        value = mock_client.cache.get('object.lookup', (('foo_id', 'id'),))
+        assert isinstance(value, cache.NegativeResult)
+    with freeze_time('2016-04-18 00:00:11'):
+        assert lookup(object, mock_client, 'id') is None
+        assert len(calls) == 2
+
+def test_negative_cache_404(mock_client):
+    calls = []
+
+    @cache.cached(ttl=100, negative_ttl=10)
+    def lookup(cls, client, foo_id):
+        calls.append(foo_id)
+        resp = requests.Response()
+        resp.status_code = 404 if foo_id == 'gone' else 500
+        resp.url = 'http://example.edu/%s' % foo_id
+        raise requests.HTTPError(response=resp)
+
+    for i in range(2):
+        with pytest.raises(requests.HTTPError) as exc:
+            lookup(object, mock_client, 'gone')
+        assert exc.value.response.status_code == 404
+        assert exc.value.response.request.url == 'http://example.edu/gone'
+    assert calls == ['gone']
+
+    # other errors aren't cached
+    for i in range(2):
+        with pytest.raises(requests.HTTPError):
+            lookup(object, mock_client, 'broken')
+    assert calls == ['gone', 'broken', 'broken']
+
+def test_negative_cache_not_stale(mock_client):
+    calls = []
+
+    @cache.cached(ttl=100, stale_ttl=50, negative_ttl=10)
+    def lookup(cls, client, foo_id):
+        calls.append(foo_id)
+        return None if len(calls) == 1 else {'id': foo_id}
+
+    with freeze_time('2016-04-18 00:00:00'):
+        assert lookup(object, mock_client, 'id') is None
+    # no stale window for "not found"; it's fetched again right away
+    with freeze_time('2016-04-18 00:00:11'):
+        assert lookup(object, mock_client, 'id') == {'id': 'id'}
+    entry = mock_client.cache._caches['object.lookup'][(('foo_id', 'id'),)]
+    assert entry.stale_until - entry.expires == 50
+
+def test_no_negative_cache(mock_client):
+    calls = []
+
+    @cache.cached(ttl=100)
+    def lookup(cls, client, foo_id):
+        calls.append(foo_id)
+
+    for i in range(3):
+        lookup(object, mock_client, 'id')
+    assert len(calls) == 3
+    # None isn't stored, so it isn't counted as a hit either
+    assert 'object.lookup' not in mock_client.cache._caches \
+        or not mock_client.cache._caches['object.lookup']
+    stats = mock_client.cache.stats()['object.lookup']
+    assert (stats['hits'], stats['misses']) == (0, 3)
+
+@pytest.mark.parametrize("value,expected", [
+    ({'state': 'SUCCEEDED'}, 3600),
+    ({'state': 'RUNNING'}, 60),
+    ({}, 60),
+    ([{'state': 'SUCCEEDED'}, {'state': 'FAILED'}], 3600),
+    ([{'state': 'SUCCEEDED'}, {'state': 'RUNNING'}], 60),
+    ([], 60),
+])
+def test_state_ttl(value, expected):
+    ttl = cache.state_ttl('state', ['SUCCEEDED', 'FAILED'], 3600, 60)
+    assert ttl(value) == expected
+
+def test_callable_ttl(mock_client):
+
+    @cache.cached(ttl=lambda value: value['ttl'])
+    def lookup(cls, client, foo_id):
+        return {'ttl': 10 * foo_id}
+
+    with freeze_time('2016-04-18 00:00:00'):
+        lookup(object, mock_client, 1)
+        lookup(object, mock_client, 2)
+    entries = mock_client.cache._caches['object.lookup']
+    assert dict((k, e.expires) for k, e in entries.items()) == {
+        (('foo_id', 1),): 1460937600.0 + 10,
+        (('foo_id', 2),): 1460937600.0 + 20,
+    }
+
+def test_extend(c):
+    with freeze_time('2016-04-18 00:00:00'):
+        c.set('foo', 'bar', 1, ttl=10)
+        assert not c.extend('foo', 'baz', 100)
+    with freeze_time('2016-04-18 00:00:05'):
+        assert c.extend('foo', 'bar', 100)
+    with freeze_time('2016-04-18 00:01:00'):
+        assert c.get('foo', 'bar') == 1
+        # the old expiration is no longer swept
+        assert c.sweep() == 0
+    with freeze_time('2016-04-18 00:01:46'):
+        assert c.get('foo', 'bar') is None
+    assert c.revalidations['foo'] == 1
+
+def test_tag_by():
+    tags = cache.tag_by('host', 'statistics.service.registration.host')
+    value = {'statistics': {'service': [
+        {'registration': {'host': 'a'}},
+        {'registration': {'host': 'b'}},
+        {'registration': {}},
+    ]}}
+    assert tags(value) == ['host:a', 'host:b']
+    assert tags([value, value]) == ['host:a', 'host:b'] * 2
+    assert tags({}) == []
+    assert cache.tag_by('workflow', 'id')({'id': 5}) == ['workflow:5']
+
+def test_invalidate_tags(c):
+    c.set('foo', 1, 'a', tags=['host:a'])
+    c.set('foo', 2, 'ab', tags=['host:a', 'host:b'])
+    c.set('bar', 1, 'b', tags=['host:b'])
+    c.set('bar', 2, 'none')
+    assert c.invalidate_tags('host:a') == 2
+    assert c.get('foo', 1) is None and c.get('foo', 2) is None
+    assert c.get('bar', 1) == 'b'
+    assert c.invalidate_tags(['host:a', 'host:b']) == 1
+    assert c.get('bar', 2) == 'none'
+    assert c.invalidations['foo'] == 2
+    assert dict(c._tag_index) == {}
+
+def test_tags_dropped_with_entries(c):
+    c.set('foo', 1, 'a', tags=['host:a'], max_entries=1)
+    c.set('foo', 2, 'b', tags=['host:b'], max_entries=1)
+    assert dict(c._tag_index) == {'host:b': set([('foo', 2)])}
+    c.set('foo', 2, 'b')
+    assert dict(c._tag_index) == {}
+    c.set('foo', 3, 'c', tags=['host:c'])
+    c.clear('foo')
+    assert dict(c._tag_index) == {}
+
+def test_cached_tags(mock_client):
+
+    @cache.cached(ttl=100, tags=[cache.tag_by('workflow', 'id'),
+                                 cache.tag_by('mediapackage', 'mp')])
+    def lookup(cls, client, foo_id):
+        return {'id': foo_id, 'mp': 'mp-%s' % foo_id}
+
+    lookup(object, mock_client, 1)
+    lookup(object, mock_client, 2)
+    assert mock_client.cache.invalidate_tags('mediapackage:mp-2') == 1
+    assert mock_client.cache.invalidate_tags('workflow:1') == 1
+
+def test_backend_invalidate_tags(db_path):
+    c1 = cache.EndpointCache(backend=backends.SQLiteCacheBackend(db_path))
+    c2 = cache.EndpointCache(backend=backends.SQLiteCacheBackend(db_path))
+    c1.set('foo', 1, 'a', tags=['host:http://a'])
+    c1.set('foo', 2, 'b', tags=['host:http://a/b'])
+    assert c2.get('foo', 1) == 'a'
+    assert c2._caches['foo'][1].tags == frozenset(['host:http://a'])
+    c2.invalidate_tags('host:http://a')
+    c3 = cache.EndpointCache(backend=backends.SQLiteCacheBackend(db_path))
+    assert c3.get('foo', 1) is None
+    assert c3.get('foo', 2) == 'b'
@@ -1,5 +1,8 @@
+import gc
 import sys
 import six
+import threading
+import mock
 
 if sys.version_info < (2,7):
     import unittest2 as unittest
@@ -11,7 +14,7 @@ if six.PY3:
 else:
     from urlparse import urlparse, parse_qs
 
-from pyhorn import MHClient, MHClientHTTPError
+from pyhorn import MHClient, MHClientHTTPError, decoders
 from httmock import all_requests, HTTMock
 
 class TestClient(unittest.TestCase):
@@ -79,3 +82,413 @@ class TestClient(unittest.TestCase):
         c = MHClient('http://matterhorn.example.edu', 'user', 'passwd')
         with HTTMock(resp_401):
             self.assertRaises(MHClientHTTPError, c.me)
+
+    def test_iter_workflows(self):
+        requested_pages = []
+
+        @all_requests
+        def resp_page(url, request):
+            params = parse_qs(urlparse(request.url).query)
+            page = int(params['startPage'][0])
+            count = int(params['count'][0])
+            requested_pages.append(page)
+            # 25 workflows total
+            ids = range(page * count, min(page * count + count, 25))
+            return {'status_code': 200,
+                    'content': {'workflows': {'workflow': [{'id': i} for i in ids]}},
+                    'headers': {'content-type': 'application/json'}}
+
+        c = MHClient('http://matterhorn.example.edu', 'user', 'passwd')
+        with HTTMock(resp_page):
+            wfs = c.iter_workflows(page_size=10, state='RUNNING')
+            first = next(wfs)
+            self.assertEqual(first.id, 0)
+            ids = [first.id] + [x.id for x in wfs]
+        self.assertEqual(ids, list(range(25)))
+        self.assertEqual(requested_pages, [0, 1, 2])
+
+    def test_iter_workflows_error(self):
+        @all_requests
+        def resp_404(url, request):
+            return {'status_code': 404}
+        c = MHClient('http://matterhorn.example.edu', 'user', 'passwd')
+        with HTTMock(resp_404):
+            self.assertRaises(MHClientHTTPError, list, c.iter_workflows())
+
+    def test_iter_user_actions(self):
+        requested = []
+
+        @all_requests
+        def resp_page(url, request):
+            params = parse_qs(urlparse(request.url).query)
+            limit = int(params['limit'][0])
+            offset = int(params['offset'][0])
+            requested.append((limit, offset))
+            ids = range(offset, min(offset + limit, 45))
+            return {'status_code': 200,
+                    'content': {'actions': {'action': [{'id': i} for i in ids]}},
+                    'headers': {'content-type': 'application/json'}}
+
+        c = MHClient('http://matterhorn.example.edu', 'user', 'passwd')
+        with HTTMock(resp_page):
+            ids = [x.id for x in c.iter_user_actions(page_size=20, offset=5)]
+        self.assertEqual(ids, list(range(5, 45)))
+        self.assertEqual(requested, [(20, 5), (20, 25), (20, 45)])
+
+    def test_iter_episodes(self):
+        @all_requests
+        def resp_page(url, request):
+            params = parse_qs(urlparse(request.url).query)
+            offset = int(params['offset'][0])
+            ids = range(offset, min(offset + int(params['limit'][0]), 15))
+            return {'status_code': 200,
+                    'content': {'search-results': {'result': [{'id': i} for i in ids]}},
+                    'headers': {'content-type': 'application/json'}}
+
+        c = MHClient('http://matterhorn.example.edu', 'user', 'passwd')
+        with HTTMock(resp_page):
+            eps = list(c.iter_episodes(page_size=10))
+            search_eps = list(c.iter_search_episodes(page_size=10))
+        self.assertEqual([x.id for x in eps], list(range(15)))
+        self.assertEqual([x.id for x in search_eps], list(range(15)))
+
+    def test_workflows_prefetch(self):
+        requested = []
+
+        @all_requests
+        def resp_content(url, request):
+            requested.append(url.path)
+            if url.path == '/workflow/instances.json':
+                content = {'workflows': {'workflow': [
+                    {'id': i, 'operations': {'operation': [{'id': 'op', 'job': 10 + i}]}}
+                    for i in range(3)]}}
+            else:
+                content = {'job': {'id': int(url.path.split('/')[-1][:-5])}}
+            return {'status_code': 200, 'content': content,
+                    'headers': {'content-type': 'application/json'}}
+
+        c = MHClient('http://matterhorn.example.edu', 'user', 'passwd')
+        with HTTMock(resp_content):
+            wfs = c.workflows(state='RUNNING', prefetch=['job', 'operations.job'])
+        self.assertEqual(len(requested), 7)
+        # no further requests on attribute access
+        self.assertEqual([wf.job.id for wf in wfs], [0, 1, 2])
+        self.assertEqual([wf.operations[0].job.id for wf in wfs], [10, 11, 12])
+        self.assertEqual(len(requested), 7)
+
+    def test_hosts_prefetch(self):
+        @all_requests
+        def resp_content(url, request):
+            if url.path == '/services/hosts.json':
+                content = {'hosts': {'host': {'base_url': 'http://foo'}}}
+            else:
+                content = {'services': {'service': [{'type': 'foo'}]}}
+            return {'status_code': 200, 'content': content,
+                    'headers': {'content-type': 'application/json'}}
+
+        c = MHClient('http://matterhorn.example.edu', 'user', 'passwd')
+        with HTTMock(resp_content):
+            hosts = c.hosts(prefetch='services')
+        self.assertIn('services', hosts[0]._property_stash)
+        self.assertEqual(hosts[0].services[0].type, 'foo')
+
+    def test_cache_list_items(self):
+        requested = []
+
+        @all_requests
+        def resp_content(url, request):
+            requested.append(url.path)
+            if url.path == '/workflow/instances.json':
+                content = {'workflows': {'workflow': [
+                    {'id': str(i), 'state': 'RUNNING'} for i in range(3)]}}
+            elif url.path.startswith('/workflow/instance/'):
+                content = {'workflow': {'id': url.path.split('/')[-1][:-5]}}
+            else:
+                content = {'search-results': {'result': [{'id': 'mp-1'}]}}
+            return {'status_code': 200, 'content': content,
+                    'headers': {'content-type': 'application/json'}}
+
+        c = MHClient('http://matterhorn.example.edu', cache_list_items=True)
+        with HTTMock(resp_content):
+            c.workflows()
+            self.assertEqual(c.workflow('1').state, 'RUNNING')
+            c.episodes()
+            c.search_episodes()
+            self.assertEqual(c.episode('mp-1').id, 'mp-1')
+            self.assertEqual(c.search_episode('mp-1').id, 'mp-1')
+            self.assertEqual(len(requested), 3)
+
+            # compact responses aren't full records
+            c.clear_cache()
+            c.workflows(compact=True)
+            c.workflow('1')
+            self.assertEqual(len(requested), 5)
+
+            # off by default
+            c = MHClient('http://matterhorn.example.edu')
+            c.workflows()
+            c.workflow('1')
+            self.assertEqual(len(requested), 7)
+
+    def test_cache_listings(self):
+        requested = []
+
+        @all_requests
+        def resp_content(url, request):
+            requested.append(url.path)
+            if url.path == '/workflow/instances.json':
+                content = {'workflows': {'workflow': [{'id': '1', 'mediapackage': {'id': 'mp-1'}}]}}
+            else:
+                content = {'search-results': {'result': [{'id': 'mp-1'}]}}
+            return {'status_code': 200, 'content': content,
+                    'headers': {'content-type': 'application/json'}}
+
+        c = MHClient('http://matterhorn.example.edu', cache_listings=True)
+        with HTTMock(resp_content):
+            wfs = c.workflows(state=['RUNNING', 'PAUSED'])
+            c.workflows(state=('RUNNING', 'PAUSED'), count=0)
+            self.assertEqual(len(requested), 1)
+            c.workflows(state='RUNNING')
+            self.assertEqual(len(requested), 2)
+
+            # the relation passes episode_id by keyword
+            c.episode('mp-1')
+            self.assertEqual(wfs[0].episode.id, 'mp-1')
+            self.assertEqual(len(requested), 3)
+
+        c = MHClient('http://matterhorn.example.edu')
+        with HTTMock(resp_content):
+            c.workflows()
+            c.workflows()
+        self.assertEqual(len(requested), 5)
+
+    def test_conditional_get(self):
+        requests_seen = []
+
+        @all_requests
+        def resp_content(url, request):
+            requests_seen.append(request.headers.get('If-None-Match'))
+            if request.headers.get('If-None-Match') == '"v1"':
+                return {'status_code': 304, 'headers': {'ETag': '"v1"'}}
+            return {'status_code': 200,
+                    'content': {'hosts': {'host': [{'base_url': 'http://foo'}]}},
+                    'headers': {'content-type': 'application/json', 'ETag': '"v1"'}}
+
+        c = MHClient('http://matterhorn.example.edu')
+        with HTTMock(resp_content):
+            first = c.get('/services/hosts.json')
+            second = c.get('/services/hosts.json')
+            # other paths aren't revalidated
+            c.get('/services/services.json')
+            c.get('/services/services.json')
+        self.assertEqual(first, second)
+        self.assertEqual(requests_seen, [None, '"v1"', None, None])
+        self.assertEqual(c.cache.revalidations['MHClient.get'], 1)
+
+        c = MHClient('http://matterhorn.example.edu', cache_enabled=False)
+        with HTTMock(resp_content):
+            c.get('/services/hosts.json')
+            c.get('/services/hosts.json')
+        self.assertEqual(requests_seen[-2:], [None, None])
+
+    def test_stream_workflows(self):
+        requested = []
+
+        @all_requests
+        def resp_content(url, request):
+            requested.append(url.query)
+            return {'status_code': 200,
+                    'content': {'workflows': {'totalCount': 2, 'workflow': [
+                        {'id': '1', 'state': 'SUCCEEDED'},
+                        {'id': '2', 'state': 'SUCCEEDED'}]}},
+                    'headers': {'content-type': 'application/json'}}
+
+        c = MHClient('http://matterhorn.example.edu', cache_list_items=True)
+        with HTTMock(resp_content):
+            wfs = c.stream_workflows(count=2)
+            self.assertEqual([x.id for x in wfs], ['1', '2'])
+            self.assertEqual(len(requested), 1)
+            c.workflow('2')
+            self.assertEqual(len(requested), 1)
+
+    def test_stream_user_actions_errors(self):
+        @all_requests
+        def resp_404(url, request):
+            return {'status_code': 404}
+
+        c = MHClient('http://matterhorn.example.edu')
+        with HTTMock(resp_404):
+            # raised when called, not when iterated
+            self.assertRaises(MHClientHTTPError, c.stream_user_actions)
+
+    def test_fields(self):
+        requested = []
+        wf = {'id': '1', 'state': 'SUCCEEDED',
+              'mediapackage': {'id': 'mp-1', 'title': 'Lecture 1'},
+              'operations': {'operation': [
+                  {'id': 'a', 'started': 1, 'completed': 3},
+                  {'id': 'b', 'started': 3, 'completed': 7}]}}
+
+        @all_requests
+        def resp_content(url, request):
+            requested.append(url.path)
+            if url.path == '/capture-admin/agents.json':
+                content = {'agents': {'agent': [{'name': 'ca1', 'state': 'idle',
+                                                 'agent-url': 'http://ca1'}]}}
+            else:
+                content = {'workflows': {'workflow': [wf]}}
+            return {'status_code': 200, 'content': content,
+                    'headers': {'content-type': 'application/json'}}
+
+        c = MHClient('http://matterhorn.example.edu', cache_list_items=True,
+                     cache_listings=True)
+        fields = ['id', 'state', 'mediapackage.id', 'operations.operation.started',
+                  'operations.operation.completed']
+        with HTTMock(resp_content):
+            wfs = c.workflows(fields=fields)
+            self.assertEqual(dict(wfs[0]._raw), {
+                'id': '1', 'state': 'SUCCEEDED', 'mediapackage': {'id': 'mp-1'},
+                'operations': {'operation': [{'started': 1, 'completed': 3},
+                                             {'started': 3, 'completed': 7}]}})
+            self.assertEqual(wfs[0].duration(), 6)
+            # cached records are complete
+            self.assertEqual(c.workflow('1').mediapackage.title, 'Lecture 1')
+            self.assertEqual(c.workflows()[0].raw_get('mediapackage.title'),
+                             'Lecture 1')
+            self.assertEqual(requested, ['/workflow/instances.json'])
+
+            wfs = list(c.iter_workflows(page_size=10, fields='id'))
+            self.assertEqual(dict(wfs[0]._raw), {'id': '1'})
+
+            agents = c.agents(fields=['agent_url'])
+            self.assertEqual(agents[0].agent_url, 'http://ca1')
+            self.assertRaises(AttributeError, getattr, agents[0], 'state')
+
+    def test_json_decoder(self):
+        decoded = []
+
+        class Decoder(decoders.StdlibDecoder):
+            def decode(self, data):
+                decoded.append(data)
+                return super(Decoder, self).decode(data)
+
+        @all_requests
+        def resp_content(url, request):
+            return {'status_code': 200,
+                    'content': u'{"title": "caf\u00e9"}'.encode('utf-8'),
+                    'headers': {'content-type': 'application/json'}}
+
+        c = MHClient('http://matterhorn.example.edu', json_decoder=Decoder())
+        with HTTMock(resp_content):
+            self.assertEqual(c.get('/foo'), {'title': u'caf\u00e9'})
+        # handed the raw bytes
+        self.assertEqual(decoded, [u'{"title": "caf\u00e9"}'.encode('utf-8')])
+
+    def test_get_decoder(self):
+        self.assertIsInstance(decoders.get_decoder('json'), decoders.StdlibDecoder)
+        self.assertRaises(ValueError, decoders.get_decoder, 'yaml')
+        decoder = decoders.StdlibDecoder()
+        self.assertIs(decoders.get_decoder(decoder), decoder)
+        for cls in (decoders.OrjsonDecoder, decoders.SimdjsonDecoder,
+                    decoders.UjsonDecoder):
+            if cls.module is None:
+                self.assertRaises(ValueError, decoders.get_decoder, cls.name)
+            else:
+                decoder = decoders.get_decoder(cls.name)
+                self.assertEqual(decoder.decode(b'{"a": [1, "b"]}'), {'a': [1, 'b']})
+                self.assertRaises(ValueError, decoder.decode, b'{"a": ')
+
+    def test_connection_pool(self):
+        c = MHClient('http://matterhorn.example.edu', pool_maxsize=32, pool_block=True)
+        adapter = c.session.get_adapter('http://matterhorn.example.edu')
+        self.assertEqual(adapter._pool_maxsize, 32)
+        self.assertTrue(adapter._pool_block)
+        # each client has its own session
+        self.assertIsNot(c.session, MHClient('http://matterhorn.example.edu').session)
+
+    def test_thread_local_sessions(self):
+        c = MHClient('http://matterhorn.example.edu', thread_local_sessions=True)
+        sessions = []
+        t = threading.Thread(target=lambda: sessions.append(c.session))
+        t.start()
+        t.join()
+        self.assertIs(c.session, c.session)
+        self.assertIsNot(c.session, sessions[0])
+        # the ended thread's session was released
+        self.assertEqual(list(c._sessions), [c.session])
+        c.close()
+        self.assertEqual(len(c._sessions), 0)
+
+    def test_thread_local_sessions_released(self):
+        c = MHClient('http://matterhorn.example.edu', thread_local_sessions=True)
+        for i in range(20):
+            t = threading.Thread(target=lambda: c.session)
+            t.start()
+            t.join()
+        gc.collect()
+        self.assertEqual(len(c._sessions), 0)
+
+        # live threads keep theirs until close()
+        started, done = threading.Event(), threading.Event()
+
+        def use_session():
+            c.session
+            started.set()
+            done.wait()
+        t = threading.Thread(target=use_session)
+        t.start()
+        started.wait()
+        self.assertEqual(len(c._sessions), 1)
+        c.close()
+        self.assertEqual(len(c._sessions), 0)
+        done.set()
+        t.join()
+
+    def test_digest_auth_reused(self):
+        c = MHClient('http://matterhorn.example.edu', 'user', 'passwd')
+        auth = c._http_auth()
+        self.assertIs(c._http_auth(), auth)
+        self.assertEqual(c.auth_challenges, 0)
+        auth.challenges = 2
+        c.passwd = 'changed'
+        self.assertIsNot(c._http_auth(), auth)
+        # still counted after the rebuild
+        self.assertEqual(c.auth_challenges, 2)
+
+    def test_digest_auth_concurrent(self):
+        c = MHClient('http://matterhorn.example.edu', 'user', 'passwd')
+        start = threading.Event()
+        auths = []
+
+        def first_request():
+            start.wait()
+            auths.append(c._http_auth())
+        threads = [threading.Thread(target=first_request) for i in range(16)]
+        for t in threads:
+            t.start()
+        start.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(set(id(x) for x in auths)), 1)
+        self.assertIs(auths[0], c._http_auth())
+
+    def test_digest_auth_challenge_count(self):
+        c = MHClient('http://matterhorn.example.edu', 'user', 'passwd')
+        auth = c._http_auth()
+        auth.init_per_thread_state()
+        auth._thread_local.num_401_calls = 1
+
+        challenge = mock.Mock(status_code=401, headers={
+            'www-authenticate': 'Digest realm="mh", nonce="abc", qop="auth"'})
+        challenge.request.copy.return_value = mock.Mock(
+            method='GET', url='http://matterhorn.example.edu/foo', headers={})
+        retried = mock.Mock(history=[])
+        challenge.connection.send.return_value = retried
+
+        with mock.patch('requests.auth.extract_cookies_to_jar'):
+            self.assertIs(auth.handle_401(challenge), retried)
+        self.assertEqual(c.auth_challenges, 1)
+
+        ok = mock.Mock(status_code=200)
+        self.assertIs(auth.handle_401(ok), ok)
+        self.assertEqual(c.auth_challenges, 1)
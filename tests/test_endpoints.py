@@ -6,11 +6,13 @@ else:
     import unittest
 
 import requests
-from pyhorn import MHClient
+from six.moves.urllib.parse import parse_qs
+from pyhorn import MHClient, MHClientHTTPError
 from pyhorn.endpoints import *
 from pyhorn.endpoints.base import *
-from httmock import HTTMock
+from httmock import HTTMock, all_requests
 from mock import patch, PropertyMock
+from freezegun import freeze_time
 from .fixtures import json_fixture
 
 class EndpointTestCase(unittest.TestCase):
@@ -80,6 +82,39 @@ class TestBaseEndpoint(EndpointTestCase):
 
         self.assertRaises(NotImplementedError, getattr, obj, "url")
 
+    def test_endpoint_obj_dashed_keys(self):
+        data = {"agent-url": "http://ca", "host_name": "ca01", "id": 1}
+        obj = WorkflowOperation(data, self.c)
+        self.assertEqual(obj.agent_url, "http://ca")
+        self.assertEqual(obj.host_name, "ca01")
+        self.assertRaises(AttributeError, getattr, obj, "no_such_key")
+        self.assertEqual(obj.raw_get("agent_url"), "http://ca")
+        self.assertEqual(dict(obj._raw),
+                         {"agent_url": "http://ca", "host_name": "ca01", "id": 1})
+        self.assertIn("agent_url", obj._raw)
+        # the response data isn't copied
+        self.assertIs(obj._data, data)
+
+    def test_projection(self):
+        record = {"id": 1, "agent-url": "u", "state": "idle",
+                  "a": {"b": [{"c": 1, "d": 2}, {"c": 3}], "e": 4},
+                  "f": {"g": 5, "h": 6}}
+        prune = projection(["id", "agent_url", "a.b.c", "f", "f.g", "x.y"])
+        self.assertEqual(prune(record), {"id": 1, "agent-url": "u",
+                                         "a": {"b": [{"c": 1}, {"c": 3}]},
+                                         "f": {"g": 5, "h": 6}})
+        # the record itself is untouched
+        self.assertEqual(record["a"]["b"][0], {"c": 1, "d": 2})
+
+    def test_endpoint_obj_compact(self):
+        obj = Workflow({"id": 1}, self.c)
+        self.assertFalse(hasattr(obj, '__dict__'))
+        self.assertRaises(AttributeError, setattr, obj, 'foo', 1)
+        # the relation stash is only allocated when needed
+        self.assertIsNone(obj._stash)
+        self.assertEqual(obj.operations, [])
+        self.assertEqual(obj._stash, {'operations': []})
+
     def test_ref_property_path(self):
 
         class Foo(EndpointObj):
@@ -145,6 +180,49 @@ class TestBaseEndpoint(EndpointTestCase):
         self.assertTrue(isinstance(ref_obj, Foo))
         self.assertEqual(ref_obj.id, 12345)
 
+    def test_resolve(self):
+        requested = []
+
+        @all_requests
+        def resp_job(url, request):
+            requested.append(url.path)
+            if url.path.endswith('/children.json'):
+                content = {"jobs": {"job": [{"id": "c1"}, {"id": "c2"}]}}
+            else:
+                content = {"job": {"id": url.path.split('/')[-1][:-5]}}
+            return {'status_code': 200, 'content': content,
+                    'headers': {'content-type': 'application/json'}}
+
+        # two ops share a job; one has no job at all
+        ops = [WorkflowOperation({"job": job_id}, self.c)
+               for job_id in ("1", "2", "1")]
+        ops.append(WorkflowOperation({}, self.c))
+
+        with HTTMock(resp_job):
+            self.c.resolve(ops, 'job.children')
+        self.assertEqual(sorted(requested), [
+            '/services/job/1.json', '/services/job/1/children.json',
+            '/services/job/2.json', '/services/job/2/children.json'])
+
+        # everything is stashed; no further requests
+        with HTTMock(resp_job):
+            self.assertEqual(ops[0].job.id, "1")
+            self.assertEqual(ops[1].job.id, "2")
+            self.assertEqual([x.id for x in ops[2].job.children], ["c1", "c2"])
+            self.assertIsNone(ops[3].job)
+        self.assertEqual(len(requested), 4)
+
+    def test_resolve_error(self):
+
+        @all_requests
+        def resp_404(url, request):
+            return {'status_code': 404}
+
+        ops = [WorkflowOperation({"job": "1"}, self.c)]
+        with HTTMock(resp_404):
+            self.assertRaises(MHClientHTTPError, self.c.resolve, ops, 'job')
+        self.assertNotIn('job', ops[0]._property_stash)
+
 class TestInfo(EndpointTestCase):
 
     def test_components(self):
@@ -187,6 +265,26 @@ class TestWorkflows(EndpointTestCase):
             wf = WorkflowEndpoint.instance(self.c, 123456)
         self.assertTrue(isinstance(wf, dict))
 
+    def test_instance_stale(self):
+        requested = []
+
+        @all_requests
+        def wf_data(url, request):
+            requested.append(url.path)
+            return {'status_code': 200,
+                    'content': {"workflow": {"id": "1", "state": "RUNNING",
+                                             "fetched": len(requested)}}}
+
+        with HTTMock(wf_data):
+            with freeze_time('2016-04-18 00:00:00'):
+                self.c.workflow(1)
+            # expired, but served stale while it's refreshed in the background
+            with freeze_time('2016-04-18 00:01:20'):
+                self.assertEqual(self.c.workflow(1).fetched, 1)
+                self.c.cache._refresher.shutdown(wait=True)
+                self.assertEqual(self.c.workflow(1).fetched, 2)
+        self.assertEqual(len(requested), 2)
+
     def test_workflow_class(self):
         wf = Workflow({
             "state": "RUNNING",
@@ -417,6 +515,22 @@ class TestEpisodes(EndpointTestCase):
 
         self.assertEqual(mp_wf.id, '123456')
 
+    def test_episode_not_found(self):
+        requested = []
+
+        @all_requests
+        def no_results(url, request):
+            requested.append(url)
+            return {'status_code': 200, 'content': {"search-results": {"total": 0}}}
+
+        with HTTMock(no_results):
+            self.assertIsNone(EpisodeEndpoint.episode(self.c, 'gone-1234'))
+            self.assertIsNone(EpisodeEndpoint.episode(self.c, 'gone-1234'))
+            self.assertIsNone(SearchEndpoint.episode(self.c, 'gone-1234'))
+            self.assertIsNone(SearchEndpoint.episode(self.c, 'gone-1234'))
+        self.assertEqual(len(requested), 2)
+        self.assertEqual(self.c.cache.negative_hits['EpisodeEndpoint.episode'], 1)
+
 class TestCaptureAgents(EndpointTestCase):
 
     def test_agents(self):
@@ -473,6 +587,72 @@ class TestCaptureAgents(EndpointTestCase):
 
 class TestServices(EndpointTestCase):
 
+    def test_job_not_found(self):
+        requested = []
+
+        @all_requests
+        def resp_404(url, request):
+            requested.append(url)
+            return {'status_code': 404}
+
+        with HTTMock(resp_404):
+            self.assertRaises(MHClientHTTPError, self.c.job, 1)
+            self.assertRaises(MHClientHTTPError, self.c.job, 1)
+            self.assertRaises(MHClientHTTPError, self.c.agent, 'gone')
+            self.assertRaises(MHClientHTTPError, self.c.agent, 'gone')
+        self.assertEqual(len(requested), 2)
+
+    def test_job_ttl(self):
+        requested = []
+
+        @all_requests
+        def job_data(url, request):
+            requested.append(url.path)
+            if url.path.endswith('children.json'):
+                jobs = [{"id": "2", "status": "FINISHED"},
+                        {"id": "3", "status": "QUEUED"}]
+                return {'status_code': 200, 'content': {"jobs": {"job": jobs}}}
+            job_id = url.path.split('/')[-1].split('.')[0]
+            status = "FINISHED" if job_id == "1" else "RUNNING"
+            return {'status_code': 200,
+                    'content': {"job": {"id": job_id, "status": status}}}
+
+        with HTTMock(job_data):
+            with freeze_time('2016-04-18 00:00:00'):
+                self.c.job(1)
+                self.c.job(2)
+                self.c.job(2).children
+            with freeze_time('2016-04-18 00:00:09'):
+                self.c.job(1)
+                self.c.job(2)
+                self.c.job(2).children
+            self.assertEqual(len(requested), 3)
+            with freeze_time('2016-04-18 01:00:00'):
+                self.c.job(1)
+                self.c.job(2)
+                self.c.job(2).children
+        # running jobs and unfinished children expired, the finished job didn't
+        self.assertEqual(len(requested), 5)
+
+    def test_children_ttl(self):
+        requested = []
+
+        @all_requests
+        def children_data(url, request):
+            requested.append(url.path)
+            jobs = [{"id": str(i), "status": "FINISHED"}
+                    for i in range(2, 2 + len(requested))]
+            return {'status_code': 200, 'content': {"jobs": {"job": jobs}}}
+
+        with HTTMock(children_data):
+            with freeze_time('2016-04-18 00:00:00'):
+                self.assertEqual(len(ServicesEndpoint.children(self.c, 1)), 1)
+                ServicesEndpoint.children(self.c, 1)
+            # all children finished, but the parent may have queued more since
+            with freeze_time('2016-04-18 00:00:11'):
+                self.assertEqual(len(ServicesEndpoint.children(self.c, 1)), 2)
+        self.assertEqual(len(requested), 2)
+
     def test_statistics(self):
 
         stat_data = json_fixture(response_data={
@@ -593,3 +773,35 @@ class TestServices(EndpointTestCase):
         host.set_maintenance(False)
         call_args, call_kwargs = mock_post.call_args
         self.assertEqual(call_kwargs['data'], {'host': 'http://foo.example.edu', 'maintenance': False})
+
+    def test_service_host_maintenance_invalidates(self):
+        requested = []
+
+        @all_requests
+        def resp_content(url, request):
+            requested.append((request.method, url.path))
+            if request.method == 'POST':
+                return {'status_code': 204}
+            if url.path == '/services/hosts.json':
+                content = {'hosts': {'host': [{'base_url': 'http://foo.example.edu'},
+                                              {'base_url': 'http://bar.example.edu'}]}}
+            else:
+                host = parse_qs(url.query)['host'][0]
+                content = {'services': {'service': [{'type': 'foo', 'host': host}]}}
+            return {'status_code': 200, 'content': content}
+
+        c = MHClient('http://matterhorn.example.edu', cache_listings=True)
+        with HTTMock(resp_content):
+            hosts = c.hosts(prefetch='services')
+            ServicesEndpoint.services(c, host='http://bar.example.edu')
+            self.assertEqual(len(requested), 3)
+
+            hosts[0].set_maintenance(True)
+            self.assertEqual(len(requested), 4)
+            # entries for the other host are kept
+            ServicesEndpoint.services(c, host='http://bar.example.edu')
+            self.assertEqual(len(requested), 4)
+            c.hosts()
+            ServicesEndpoint.services(c, host='http://foo.example.edu')
+            self.assertEqual(len(requested), 6)
+        self.assertEqual(c.cache.invalidations['ServicesEndpoint.hosts'], 1)
@@ -0,0 +1,108 @@
+import json
+import time
+import pytest
+from pyhorn import utils
+
+def test_iter_pages():
+    def fetch_page(page_num):
+        return list(range(page_num * 10, min(page_num * 10 + 10, 35)))
+    pages = list(utils.iter_pages(fetch_page, 10))
+    assert [len(x) for x in pages] == [10, 10, 10, 5]
+    assert sum(pages, []) == list(range(35))
+
+def test_iter_pages_read_ahead():
+    fetched = []
+
+    def fetch_page(page_num):
+        fetched.append(page_num)
+        return [page_num] * 10
+
+    pages = utils.iter_pages(fetch_page, 10, read_ahead=2)
+    assert next(pages) == [0] * 10
+    time.sleep(0.2)
+    # one page consumed, two queued, one blocked waiting for room
+    assert len(fetched) == 4
+    pages.close()
+
+def test_iter_pages_close_stops_fetching():
+    fetched = []
+
+    def fetch_page(page_num):
+        fetched.append(page_num)
+        return [page_num] * 10
+
+    pages = utils.iter_pages(fetch_page, 10, read_ahead=1)
+    next(pages)
+    pages.close()
+    time.sleep(0.3)
+    fetch_count = len(fetched)
+    time.sleep(0.3)
+    assert len(fetched) == fetch_count
+
+def test_iter_pages_error():
+    def fetch_page(page_num):
+        if page_num == 1:
+            raise RuntimeError("boom")
+        return [page_num] * 10
+    pages = utils.iter_pages(fetch_page, 10)
+    assert next(pages) == [0] * 10
+    with pytest.raises(RuntimeError):
+        next(pages)
+
+def test_iter_pages_bad_page_size():
+    with pytest.raises(ValueError):
+        next(utils.iter_pages(lambda x: [], 0))
+
+@pytest.mark.parametrize("read_ahead", [0, -1])
+def test_iter_pages_bad_read_ahead(read_ahead):
+    fetched = []
+
+    def fetch_page(page_num):
+        fetched.append(page_num)
+        return [page_num]
+
+    with pytest.raises(ValueError):
+        next(utils.iter_pages(fetch_page, 1, read_ahead))
+    assert fetched == []
+
+def _chunks(data, size):
+    data = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def test_iter_json_items():
+    items = [{"id": "w\u00e9-%d" % i, "ops": [{"x": "]}\\\""}] * i} for i in range(20)]
+    items.append(12345)
+    doc = {"other": {"workflow": [1]},
+           "workflows": {"totalCount": 21, "workflow": items, "more": "x"}}
+    for size in (1, 3, 64, 65536):
+        assert list(utils.iter_json_items(_chunks(doc, size),
+                                          ('workflows', 'workflow'))) == items
+
+def test_iter_json_items_incremental():
+    chunks = _chunks({"actions": {"action": [{"id": 1}, {"id": 2}]}}, 4)
+    read = []
+
+    def reader():
+        for chunk in chunks:
+            read.append(chunk)
+            yield chunk
+
+    items = utils.iter_json_items(reader(), ('actions', 'action'))
+    assert next(items) == {"id": 1}
+    assert len(read) < len(chunks)
+
+def test_iter_json_items_single_or_missing():
+    path = ('workflows', 'workflow')
+    single = _chunks({"workflows": {"workflow": {"id": 1}}}, 5)
+    assert list(utils.iter_json_items(single, path)) == [{"id": 1}]
+    empty = _chunks({"workflows": {"totalCount": 0}}, 5)
+    assert list(utils.iter_json_items(empty, path)) == []
+    with pytest.raises(KeyError):
+        list(utils.iter_json_items(_chunks({"foo": {}}, 5), path))
+
+def test_iter_json_items_truncated():
+    chunks = _chunks({"workflows": {"workflow": [{"id": 1}, {"id": 2}]}}, 5)[:-3]
+    items = utils.iter_json_items(chunks, ('workflows', 'workflow'))
+    assert next(items) == {"id": 1}
+    with pytest.raises(ValueError):
+        next(items)